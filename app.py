@@ -9,7 +9,8 @@ import sys
 import subprocess
 import io
 import csv
-from typing import Dict, Any, Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Set
 import numpy as np
 import cv2
 import shutil
@@ -21,9 +22,13 @@ from openpyxl import Workbook
 from openpyxl.styles import Font
 
 from flask import Flask, jsonify, render_template, request, send_file, Response, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from database_models import SessionLocal, Employee, Camera, FaceTemplate, Attendance, Presence, Event, AlertLog, init_db
 from database_models import seed_cameras_from_configs
+from capture import open_capture
+from frame_store import EncodedFrameCache
+from stream_quality import ViewerState, build_tiers
+from attendance_capture import AttendanceCaptureService
 
 # --- System Uptime Tracking ---
 _system_start_time = None
@@ -70,54 +75,148 @@ _saver_thread_started = False
 # Dedicated Attendance Captures dir
 ATT_CAPTURES_DIR = os.path.join(BASE_DIR, 'attendance_captures')
 os.makedirs(ATT_CAPTURES_DIR, exist_ok=True)
+# Attendance photos are written by a background service (created on first use)
+_att_capture_service: Optional[AttendanceCaptureService] = None
+_att_capture_service_lock = threading.Lock()
+
+# Disk writes for periodic frame captures run on a small pool; at most _CAPTURE_IO_MAX_PENDING
+# writes wait at a time, further ones are dropped (the next periodic capture replaces them)
+_CAPTURE_IO_MAX_PENDING = 16
+_capture_io = ThreadPoolExecutor(max_workers=2, thread_name_prefix='capture-io')
+_capture_io_slots = threading.BoundedSemaphore(_CAPTURE_IO_MAX_PENDING)
+
+
+def _submit_capture_io(fn, *args) -> bool:
+    """Run fn(*args) on the capture I/O pool; False (and nothing queued) when the pool is saturated."""
+    if not _capture_io_slots.acquire(blocking=False):
+        print("[Frame Capture] I/O queue full, dropping write")
+        return False
+
+    def _run():
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"[Frame Capture] Write failed: {e}")
+        finally:
+            _capture_io_slots.release()
+    try:
+        _capture_io.submit(_run)
+    except Exception:
+        _capture_io_slots.release()
+        return False
+    return True
+
+
+def _camera_status_items() -> List[Dict[str, Any]]:
+    """AI and stream status per configured camera (same items as /api/cameras/status)."""
+    cams = load_cameras()
+    items = []
+    for cam_id in sorted(cams.keys()):
+        ai_running = False
+        try:
+            ai_running = bool(ai_manager and hasattr(ai_manager, 'is_camera_running') and ai_manager.is_camera_running(cam_id))
+        except Exception:
+            ai_running = False
+        items.append({
+            'id': cam_id,
+            'name': cams[cam_id].get('name') or f'CAM{cam_id}',
+            'ai_running': ai_running,
+            'stream_enabled': bool(cams[cam_id].get('stream_enabled', True)),
+        })
+    return items
+
 
 def _list_camera_status() -> List[Dict[str, Any]]:
-    """Return camera status list similar to /api/cameras/status items.
-    Falls back to configs with stream_enabled when status API unavailable."""
-    try:
-        import urllib.request
-        req = urllib.request.Request('http://127.0.0.1:5000/api/cameras/status')
-        with urllib.request.urlopen(req, timeout=2.5) as resp:
-            data = json.loads(resp.read().decode('utf-8'))
-            items = data.get('items') if isinstance(data, dict) else None
-            if isinstance(items, list):
-                return items
+    try:
+        return _camera_status_items()
+    except Exception:
+        return []
+
+
+def _grab_camera_jpeg(cam_id: int, annotate: bool = True, full: bool = False) -> Optional[bytes]:
+    """Current frame of a camera as JPEG, taken in-process.
+
+    AI cameras use ai_manager's frames and published detections (the working frame comes
+    from the shared encode cache, so the snapshot route and saver encode it once). Other
+    cameras use the live stream broadcaster's newest frame if someone is watching, else
+    a one-off grab from the source.
+    """
+    running = False
+    try:
+        running = bool(ai_manager and ai_manager.is_camera_running(cam_id))
+    except Exception:
+        running = False
+    if running:
+        if full and hasattr(ai_manager, 'get_full_frame'):
+            frame = ai_manager.get_full_frame(cam_id, annotate=annotate)
+            return _encode_jpeg(frame) if isinstance(frame, np.ndarray) else None
+        _seq, _ts, data = ai_manager.get_encoded_frame(cam_id, max_width=0, quality=95, annotated=annotate)
+        return data
+    with _broadcast_lock:
+        bc = _broadcasters.get(cam_id)
+    latest = bc.latest_frame() if bc is not None else None
+    if latest is not None and time.time() - latest[1] < 5.0:
+        frame = latest[2].copy()  # annotation draws in place; the broadcaster's frame is shared
+    else:
+        cam = load_cameras().get(cam_id) or {}
+        if not cam.get('rtsp_url'):
+            return None
+        frame = _grab_frame_once(cam['rtsp_url'])
+    if frame is None:
+        return None
+    annotated = _apply_annotation(frame, cam_id, annotate)
+    return _encode_jpeg(annotated if annotated is not None else frame)
+
+
+def _grab_frame_once(src: str, timeout_sec: float = 2.0) -> Optional[np.ndarray]:
+    cap = None
+    try:
+        cap = open_capture(src, load_params())
+        if not cap or not cap.isOpened():
+            return None
+        t0 = time.time()
+        while time.time() - t0 < timeout_sec:
+            ok, frame = cap.read()
+            if ok and frame is not None:
+                return frame
+            time.sleep(0.02)
+        return None
+    except Exception:
+        return None
+    finally:
+        try:
+            if cap is not None:
+                cap.release()
+        except Exception:
+            pass
+
+
+def _write_camera_snapshot(cam_id: int, fname: str, data: bytes) -> None:
+    cam_dir = os.path.join(CAPTURES_DIR, str(int(cam_id)))
+    os.makedirs(cam_dir, exist_ok=True)
+    with open(os.path.join(cam_dir, fname), 'wb') as f:
+        f.write(data)
+    # Rotate to max 5 files
+    try:
+        files = sorted([x for x in os.listdir(cam_dir) if x.lower().endswith('.jpg')])
+        if len(files) > 5:
+            for old in files[0:len(files)-5]:
+                try: os.remove(os.path.join(cam_dir, old))
+                except Exception: pass
     except Exception:
         pass
-    # Fallback: load from configs and assume stream_enabled as activity
-    cams = load_cameras()
-    out = []
-    for cid, meta in cams.items():
-        out.append({'id': cid, 'ai_running': False, 'stream_enabled': bool(meta.get('stream_enabled', False))})
-    return out
+    print(f"[Frame Capture] Saved snapshot for CAM{cam_id}: {fname}")
+
 
 def _save_snapshot_for_camera(cam_id: int) -> bool:
-    """Fetch snapshot from our own API and store to captures/<cam_id>/; return True if saved."""
+    """Take the camera's current annotated frame and queue it for captures/<cam_id>/; True if queued."""
     try:
-        import urllib.request
         # Use WIB timezone for filename timestamp (consistent with system)
         ts = _now_wib().strftime('%Y%m%d_%H%M%S')
-        url = f'http://127.0.0.1:5000/api/cameras/{int(cam_id)}/snapshot?annotate=1'
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=4.0) as resp:
-            data = resp.read()
-        cam_dir = os.path.join(CAPTURES_DIR, str(int(cam_id)))
-        os.makedirs(cam_dir, exist_ok=True)
-        fname = f'{ts}.jpg'
-        fpath = os.path.join(cam_dir, fname)
-        with open(fpath, 'wb') as f:
-            f.write(data)
-        # Rotate to max 5 files
-        try:
-            files = sorted([x for x in os.listdir(cam_dir) if x.lower().endswith('.jpg')])
-            if len(files) > 5:
-                for old in files[0:len(files)-5]:
-                    try: os.remove(os.path.join(cam_dir, old))
-                    except Exception: pass
-        except Exception:
-            pass
-        print(f"[Frame Capture] Saved snapshot for CAM{cam_id}: {fname}")
-        return True
+        data = _grab_camera_jpeg(int(cam_id), annotate=True)
+        if data is None:
+            return False
+        return _submit_capture_io(_write_camera_snapshot, int(cam_id), f'{ts}.jpg', data)
     except Exception as e:
         print(f"[Frame Capture] Failed to save snapshot for CAM{cam_id}: {e}")
         return False
@@ -149,12 +248,9 @@ def _ensure_saver_started():
 def _start_capture_saver_thread():
     _ensure_saver_started()
 
-_workers_by_sid: Dict[str, Any] = {}
 # Camera status cache with bounded size and TTL to prevent memory leaks
 _CAM_STATUS_TTL = 10.0  # seconds
 _cam_status_cache: TTLCache = TTLCache(maxsize=100, ttl=_CAM_STATUS_TTL)
-# Optional: Face embedding engine (lazy)
-_face_app = None
 # Directory to store cropped face images per template
 FACE_IMG_DIR = os.path.join(BASE_DIR, 'face_images')
 
@@ -223,37 +319,27 @@ def _to_wib_string(dtobj: Optional[dt.datetime]) -> str:
 
 
 def _get_face_app():
-    global _face_app
-    if _face_app is not None:
-        return _face_app
-    try:
-        from insightface.app import FaceAnalysis
-        # Use the same providers and detection size as module_AI (from parameter_config.json)
-        det_size = (640, 640)
-        providers = ['CPUExecutionProvider']
-        try:
-            if ai_manager is not None and hasattr(ai_manager, 'engine') and ai_manager.engine is not None:
-                det_size = tuple(ai_manager.engine.det_size)
-                providers = list(ai_manager.engine.providers)
-        except Exception:
-            pass
-        # Try with configured providers first, then fallback to defaults
-        try:
-            # Tentukan ctx_id=0 (GPU) hanya jika provider GPU/TensorRT ada.
-            ctx = 0 if any('CUDA' in p or 'Tensorrt' in p for p in providers) else -1
-            
-            _face_app = FaceAnalysis(name='buffalo_l', providers=providers)
-            _face_app.prepare(ctx_id=ctx, det_size=det_size) # Menggunakan ctx yang sudah ditentukan
-            return _face_app
-        except Exception as e1:
-            print(f"FaceAnalysis init with providers {providers} failed: {e1}. Retrying with default providers...")
-            # Saat fallback, pastikan tidak ada panggilan ke GPU
-            _face_app = FaceAnalysis(name='buffalo_l')
-            _face_app.prepare(ctx_id=-1, det_size=det_size) # Gunakan ctx_id=-1 (CPU)
-            return _face_app
+    """Return the shared face engine owned by the AI manager, or None if it is unavailable.
+
+    Enrollment and snapshot annotation reuse the tracking engine instead of loading a
+    second buffalo_l model; its request queue serializes concurrent callers.
+    """
+    try:
+        engine = getattr(ai_manager, 'engine', None) if ai_manager is not None else None
+        if engine is not None and getattr(engine, 'app', None) is not None:
+            return engine
+    except Exception:
+        pass
+    return None
+
+
+def _publish_gallery_delta(emp_id: int, **delta) -> None:
+    """Forward an employee/face template change to the in-memory recognition gallery."""
+    try:
+        if ai_manager is not None and hasattr(ai_manager, 'apply_embedding_delta'):
+            ai_manager.apply_embedding_delta(int(emp_id), **delta)
     except Exception as e:
-        print(f"Failed to init FaceAnalysis: {e}")
-        return None
+        print(f"[AI] Gallery update failed for employee {emp_id}: {e}")
 
 
 def load_cameras() -> Dict[int, Dict[str, Any]]:
@@ -814,21 +900,7 @@ def api_cameras():
 @app.route('/api/cameras/status')
 def api_cameras_status():
     """Return current AI and Stream status per camera for UI polling."""
-    cams = load_cameras()
-    items = []
-    for cam_id in sorted(cams.keys()):
-        ai_running = False
-        try:
-            ai_running = bool(ai_manager and hasattr(ai_manager, 'is_camera_running') and ai_manager.is_camera_running(cam_id))
-        except Exception:
-            ai_running = False
-        items.append({
-            'id': cam_id,
-            'name': cams[cam_id].get('name') or f'CAM{cam_id}',
-            'ai_running': ai_running,
-            'stream_enabled': bool(cams[cam_id].get('stream_enabled', True)),
-        })
-    return jsonify({'items': items})
+    return jsonify({'items': _camera_status_items()})
 
 
 @app.route('/api/cameras', methods=['POST'])
@@ -951,68 +1023,38 @@ def _nearest_capture_for(cam_id: int, target_ts: dt.datetime, max_delta_sec: int
     except Exception:
         return ''
 
-def _save_attendance_capture(emp_id: int, cam_id: int, ts: dt.datetime, kind: str, meta: Dict[str, Any], overwrite: bool = False):
-    """Save attendance capture image and meta under attendance_captures/YYYY-MM-DD/<emp_id>/.
-    kind: 'first_in' or 'last_out'
+def _attendance_capture_service() -> AttendanceCaptureService:
+    global _att_capture_service
+    with _att_capture_service_lock:
+        if _att_capture_service is None:
+            params = load_params()
+            _att_capture_service = AttendanceCaptureService(
+                ATT_CAPTURES_DIR,
+                lambda cam_id: _grab_camera_jpeg(cam_id, annotate=True, full=True),
+                format_ts=_to_iso_utc,
+                max_pending=int(params.get('attendance_capture_queue_max', 64) or 64),
+                batch_window_sec=float(params.get('attendance_capture_batch_ms', 200) or 0) / 1000.0,
+            )
+        return _att_capture_service
+
+
+def _save_attendance_capture(emp_id: int, cam_id: int, ts: dt.datetime, kind: str, meta: Dict[str, Any],
+                             overwrite: bool = False, delay_sec: float = 0.0):
+    """Queue an attendance capture (image + meta under attendance_captures/YYYY-MM-DD/<emp_id>/).
+    kind: 'first_in' or 'last_out'. Returns immediately; the frame is grabbed and written by
+    the attendance capture service, delay_sec after the call.
     """
     try:
-        day = (ts.date() if isinstance(ts, dt.datetime) else dt.date.today()).isoformat()
-        root = os.path.join(ATT_CAPTURES_DIR, day, str(int(emp_id)))
-        os.makedirs(root, exist_ok=True)
-        # Strict write-once guarantee for FIRST IN unless overwrite is forced
-        if kind == 'first_in' and not overwrite:
-            try:
-                if os.path.isfile(os.path.join(root, 'first_in.jpg')):
-                    try:
-                        print(f"[attendance] skip first_in: already exists for emp={emp_id} day={day}")
-                    except Exception:
-                        pass
-                    return
-            except Exception:
-                # If any issue checking file existence, fall through to normal save
-                pass
-        # Fetch snapshot
-        import urllib.request
-        url = f'http://127.0.0.1:5000/api/cameras/{int(cam_id)}/snapshot?annotate=1'
-        with urllib.request.urlopen(url, timeout=4.0) as resp:
-            img = resp.read()
-        fname = 'first_in.jpg' if kind == 'first_in' else 'last_out.jpg'
-        target_path = os.path.join(root, fname)
-        with open(target_path, 'wb') as f:
-            f.write(img)
-        try:
-            print(f"[attendance] saved {kind}: emp={emp_id} cam={cam_id} day={day} file={target_path}")
-        except Exception:
-            pass
-        # Write meta.json
-        meta_path = os.path.join(root, 'meta.json')
-        try:
-            old = {}
-            if os.path.isfile(meta_path):
-                with open(meta_path, 'r', encoding='utf-8') as mf:
-                    old = json.load(mf) or {}
-        except Exception:
-            old = {}
-        if kind == 'first_in':
-            old['first_in'] = {
-                'ts': _to_iso_utc(ts) if isinstance(ts, dt.datetime) else None,
-                'cam_id': int(cam_id),
-                'cam_name': meta.get('name'),
-                'cam_area': meta.get('area'),
-                'file': fname,
-            }
-        else:
-            old['last_out'] = {
-                'ts': _to_iso_utc(ts) if isinstance(ts, dt.datetime) else None,
-                'cam_id': int(cam_id),
-                'cam_name': meta.get('name'),
-                'cam_area': meta.get('area'),
-                'file': fname,
-            }
-        with open(meta_path, 'w', encoding='utf-8') as mf:
-            json.dump(old, mf, indent=2)
-    except Exception:
-        pass
+        _attendance_capture_service().submit(emp_id, cam_id, ts, kind, meta, overwrite=overwrite, delay_sec=delay_sec)
+    except Exception as e:
+        print(f"[attendance] failed to queue {kind}: emp={emp_id} cam={cam_id}: {e}")
+
+
+def flush_attendance_captures(timeout: float = 5.0) -> None:
+    """Write queued attendance captures now (delays ignored) and stop the service; call before AI stops."""
+    svc = _att_capture_service
+    if svc is not None:
+        svc.close(timeout)
 
 @app.route('/api/report/attendance_captures')
 def api_report_attendance_captures():
@@ -1326,7 +1368,7 @@ def _annotate_faces(frame: Optional[np.ndarray]) -> Optional[np.ndarray]:
         app_engine = _get_face_app()
         if app_engine is None:
             return frame
-        faces = app_engine.get(frame)
+        faces = app_engine.get_faces(frame)
         if not faces:
             return frame
         out = frame.copy()
@@ -1360,9 +1402,26 @@ def _apply_annotation(frame: Optional[np.ndarray], cam_id: Optional[int], annota
 @app.route('/api/cameras/<int:cam_id>/snapshot')
 def api_camera_snapshot(cam_id: int):
     annotate = str(request.args.get('annotate') or '').strip() in ('1', 'true', 'yes', 'on')
+    full = str(request.args.get('full') or '').strip() in ('1', 'true', 'yes', 'on')
     # 1) Try AI manager last-frame buffer, if provided by implementation
     try:
         if ai_manager is not None:
+            # Source-resolution frame (working frames are capped at capture_max_width)
+            if full and hasattr(ai_manager, 'get_full_frame'):
+                try:
+                    frame = ai_manager.get_full_frame(cam_id, annotate=annotate)
+                    if isinstance(frame, np.ndarray):
+                        return Response(_encode_jpeg(frame), mimetype='image/jpeg')
+                except Exception:
+                    pass
+            # Newest working frame, encoded once and shared with other snapshot callers/viewers
+            if not full and hasattr(ai_manager, 'get_encoded_frame'):
+                try:
+                    _seq, _ts, data = ai_manager.get_encoded_frame(cam_id, max_width=0, quality=95, annotated=annotate)
+                    if data is not None:
+                        return Response(data, mimetype='image/jpeg')
+                except Exception:
+                    pass
             # Common callable methods
             for attr in ['get_last_frame', 'get_snapshot', 'snapshot', 'last_frame', 'frame_for']:
                 if hasattr(ai_manager, attr):
@@ -1472,6 +1531,87 @@ def api_camera_snapshot(cam_id: int):
         return jsonify({'error': str(e)}), 500
 
 
+# Idle MJPEG connections write at least this often so client disconnects are detected
+_MJPEG_KEEPALIVE_SEC = 5.0
+
+
+@app.route('/api/cameras/<int:cam_id>/mjpeg')
+def api_camera_mjpeg(cam_id: int):
+    """Live MJPEG (multipart/x-mixed-replace) stream for <img> tags, NVR displays and other HTTP clients.
+
+    Fed from the camera's stream broadcaster, so frames are captured and encoded once however
+    many consumers watch. Query: fps (capped at fps_target, default mjpeg_fps), width, quality,
+    annotate (default 1).
+    """
+    cam = load_cameras().get(cam_id)
+    if not cam:
+        return jsonify({'error': 'camera_not_found'}), 404
+    if not bool(cam.get('stream_enabled', True)):
+        return jsonify({'error': 'stream_disabled'}), 403
+    if not cam.get('rtsp_url'):
+        return jsonify({'error': 'no_rtsp'}), 404
+    params = load_params()
+    prefs = {'max_width': 960, 'jpeg_quality': 70, 'target_fps': 10}
+    try:
+        if ai_manager is not None and hasattr(ai_manager, 'get_stream_preferences'):
+            prefs.update(ai_manager.get_stream_preferences())
+    except Exception:
+        pass
+    try:
+        fps = float(request.args.get('fps') or params.get('mjpeg_fps', 5))
+        width = int(request.args.get('width') or prefs['max_width'])
+        quality = int(request.args.get('quality') or prefs['jpeg_quality'])
+    except Exception:
+        return jsonify({'error': 'invalid_parameters'}), 400
+    # Per-connection caps: never faster than capture, never wider than the stream setting
+    fps = max(0.2, min(fps, float(prefs['target_fps'])))
+    width = max(160, min(width, int(prefs['max_width'])))
+    quality = max(20, min(quality, 95))
+    annotate = str(request.args.get('annotate', '1')).strip() in ('1', 'true', 'yes', 'on')
+
+    def part(jpeg: bytes) -> bytes:
+        return (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                + str(len(jpeg)).encode('ascii') + b'\r\n\r\n' + jpeg + b'\r\n')
+
+    def generate():
+        bc = acquire_stream_listener(cam_id, cam.get('rtsp_url', ''))
+        try:
+            interval = 1.0 / fps
+            last_seq, last_ai = 0, None
+            last_jpeg = None
+            next_due = time.monotonic()
+            next_keepalive = time.monotonic() + _MJPEG_KEEPALIVE_SEC
+            # Also ends if the broadcaster thread died without setting stop_event
+            while not bc.stop_event.is_set() and bc.thread.is_alive():
+                seq, _ts, jpeg, from_ai = bc.next_jpeg(last_seq, width, quality, annotated=annotate, timeout=1.0)
+                if from_ai != last_ai:
+                    # AI and raw frames are numbered separately: restart the sequence on a switch
+                    last_seq, last_ai = 0, from_ai
+                if jpeg is None:
+                    # No frames: write something now and then, a disconnected client is only
+                    # noticed on write (the previous frame again, or a CRLF preamble before the first)
+                    if time.monotonic() >= next_keepalive:
+                        next_keepalive = time.monotonic() + _MJPEG_KEEPALIVE_SEC
+                        yield part(last_jpeg) if last_jpeg is not None else b'\r\n'
+                    continue
+                # May be lower than last_seq when the camera's AI was restarted (new frame ring)
+                last_seq = seq
+                last_jpeg = jpeg
+                next_keepalive = time.monotonic() + _MJPEG_KEEPALIVE_SEC
+                yield part(jpeg)
+                next_due = max(next_due + interval, time.monotonic())
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            # Runs when the client disconnects (generator closed)
+            release_stream_listener(cam_id, bc)
+
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame',
+                    headers={'Cache-Control': 'no-cache, no-store, must-revalidate', 'Pragma': 'no-cache'},
+                    direct_passthrough=True)
+
+
 # --- Reports: Attendance & Alert Logs ---
 
 # Helper function: Check if timestamp falls within time range
@@ -1983,15 +2123,12 @@ def api_alert_logs_create():
                         first_path = os.path.join(day_dir, 'first_in.jpg')
                         exists = os.path.isfile(first_path)
                         if (not exists) or overwrite_first:
-                            _save_attendance_capture(int(emp_id), int(cam_id), now_utc, 'first_in', meta)
+                            _save_attendance_capture(int(emp_id), int(cam_id), now_utc, 'first_in', meta,
+                                                     overwrite=overwrite_first)
                     elif alert_type == 'EXIT':
                         # Optionally delay last_out capture to allow more stable frame
-                        def _do_last_out_save():
-                            _save_attendance_capture(int(emp_id), int(cam_id), now_utc, 'last_out', meta)
-                        if delay_sec and delay_sec > 0:
-                            threading.Thread(target=lambda: (time.sleep(max(0, delay_sec)), _do_last_out_save()), daemon=True).start()
-                        else:
-                            _do_last_out_save()
+                        _save_attendance_capture(int(emp_id), int(cam_id), now_utc, 'last_out', meta,
+                                                 delay_sec=max(0, delay_sec))
             except Exception:
                 pass
         return jsonify({'ok': True})
@@ -2085,6 +2222,7 @@ def add_employee():
         )
         db.add(e)
         db.commit()
+        _publish_gallery_delta(e.id, meta={'name': e.name, 'department': e.department})
         return jsonify({'id': e.id}), 201
 
 
@@ -2147,6 +2285,7 @@ def update_employee(eid: int):
             # Do not block on attendance sync error
             pass
         db.commit()
+        _publish_gallery_delta(eid, meta={'name': e.name, 'department': e.department})
         return jsonify({'ok': True})
 
 
@@ -2166,6 +2305,7 @@ def delete_employee(eid: int):
         # 2) Delete employee row
         db.delete(e)
         db.commit()
+        _publish_gallery_delta(eid, deleted=True)
         # 3) Remove face images directory from filesystem (non-fatal)
         try:
             # Remove name-based folder and legacy id-based folder
@@ -2216,7 +2356,7 @@ def add_face_template(eid: int):
         return jsonify({'error': f'bad image: {e}'}), 400
     # Detect face and get embedding
     try:
-        faces = app_engine.get(frame)
+        faces = app_engine.get_faces(frame)
         if not faces:
             return jsonify({'error': 'no_face'}), 422
         def area(f):
@@ -2263,6 +2403,8 @@ def add_face_template(eid: int):
         ft = FaceTemplate(employee_id=eid, embedding=emb_bytes, pose_label=pose_label, quality_score=quality_score)
         db.add(ft)
         db.commit()
+        # Make the new template recognizable immediately
+        _publish_gallery_delta(eid, added=[(ft.id, emb)])
 
         # After we have ft.id, save cropped face image to filesystem
         try:
@@ -2337,6 +2479,7 @@ def clear_face_templates(eid: int):
             # Delete DB rows
             db.query(FaceTemplate).filter(FaceTemplate.employee_id == eid).delete(synchronize_session=False)
             db.commit()
+            _publish_gallery_delta(eid, clear=True)
             # Remove images directory
             try:
                 emp_dir = _employee_image_dir(emp)
@@ -2389,15 +2532,14 @@ def _get_camera_online_cached(cam_id: int, rtsp_url: str) -> bool:
 class RTSPFrameSource:
     """
     Simple source that reads frames from an RTSP URL or a numeric webcam index.
-    Uses OpenCV VideoCapture for both RTSP and webcam.
+    Uses the configured capture backend (see capture.py), falling back to OpenCV.
     """
     def __init__(self, url: str):
         self.url = url
         self._cap = None
 
     def open(self):
-        src = int(self.url) if self.url.isdigit() else self.url
-        self._cap = cv2.VideoCapture(src)
+        self._cap = open_capture(self.url, load_params())
         if not self._cap or not self._cap.isOpened():
             raise RuntimeError('Failed to open video source')
 
@@ -2428,129 +2570,401 @@ def cameras_status_legacy():
     return jsonify(items)
 
 
-class StreamWorker:
-    def __init__(self, sid: str, cam_id: int, rtsp_url: str):
-        self.sid = sid
+class StreamBroadcaster:
+    """One per camera: produces each frame once and sends it to every viewer of the camera.
+
+    With AI running for the camera, frames come from ai_manager (its capture, its shared
+    encode cache); otherwise the broadcaster opens the RTSP source itself, once, however
+    many browsers watch. The source is re-checked while streaming, so toggling AI does not
+    leave a second connection open to the camera.
+
+    Each viewer has its own width/quality tier and fps (see stream_quality), adapted from
+    how fast it acks frames; every distinct tier is encoded once per frame. HTTP consumers
+    (MJPEG) register as listeners and pull encoded frames with next_jpeg().
+    """
+    AI_CHECK_SEC = 2.0
+
+    def __init__(self, cam_id: int, rtsp_url: str):
         self.cam_id = cam_id
         self.rtsp_url = rtsp_url
+        self.room = f'stream_cam_{cam_id}'
+        self.viewers: Dict[str, ViewerState] = {}
+        self.listeners = 0
+        self.frames_sent = 0
+        self.ai_running = False
+        # Newest raw (no AI) frame as (seq, ts, frame) for listeners
+        self._latest: Optional[tuple] = None
+        self._frame_cond = threading.Condition()
+        # Read AI/stream preferences once
+        prefs = {
+            'max_width': 960,
+            'jpeg_quality': 70,
+            'annotation_stride': 3,
+            'target_fps': 10,
+        }
+        try:
+            if ai_manager is not None and hasattr(ai_manager, 'get_stream_preferences'):
+                prefs.update(ai_manager.get_stream_preferences())
+        except Exception:
+            pass
+        self.target_fps = max(1, int(prefs.get('target_fps', 10)))
+        self.tiers = build_tiers(int(prefs.get('max_width', 960)), int(prefs.get('jpeg_quality', 70)))
+        # Encodes of raw (no AI) frames, shared by viewers on the same tier
+        self._raw_cache = EncodedFrameCache()
         self.stop_event = threading.Event()
-        self.thread = threading.Thread(target=self.run, daemon=True)
-        # Shared state (no direct capture; frames come from ai_manager)
-        self.frame_lock = threading.Lock()
-        # Non-blocking annotation
-        self._frame_counter = 0
-        self.annotate_busy = False
-        self.annotate_thread: Optional[threading.Thread] = None
-        self.last_annotated_frame: Optional[np.ndarray] = None
+        self.thread = threading.Thread(target=self.run, name=f'StreamBroadcaster-{cam_id}', daemon=True)
 
     def start(self):
         self.thread.start()
 
     def stop(self):
         self.stop_event.set()
-        # Nothing else to stop; AI manager owns the capture
+
+    def add_viewer(self, sid: str, constraints: Optional[Dict[str, Any]] = None) -> None:
+        self.viewers[sid] = ViewerState(sid, self.tiers, self.target_fps, constraints)
+
+    def _ai_running(self) -> bool:
+        try:
+            return bool(ai_manager and hasattr(ai_manager, 'is_camera_running') and ai_manager.is_camera_running(self.cam_id))
+        except Exception:
+            return False
+
+    def _encode_raw(self, frame, width: int, quality: int) -> Optional[bytes]:
+        h, w = frame.shape[:2]
+        # Downscale to reduce bandwidth/CPU
+        if w > width:
+            scale = width / float(w)
+            frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+        ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+        return buf.tobytes() if ok else None
+
+    def next_jpeg(self, after_seq: int, width: int, quality: int, annotated: bool = True,
+                  timeout: float = 1.0):
+        """(seq, ts, jpeg, from_ai) of the first frame newer than after_seq; jpeg is None on timeout.
+
+        AI and raw frames are numbered separately and an AI frame ring restarts at 1 when its camera
+        is restarted, so a frame numbered below after_seq is returned too (after_seq then belongs to
+        a previous counter); callers just continue from the returned seq.
+        """
+        if self.ai_running:
+            seq, ts, frame = ai_manager.wait_new_frame(self.cam_id, after_seq, timeout=timeout)
+            if frame is None:
+                return 0, 0.0, None, True
+            seq, ts, jpeg = ai_manager.get_encoded_frame(
+                self.cam_id, width, quality, annotated=annotated, frame_ref=(seq, ts, frame))
+            return seq, ts, jpeg, True
+        with self._frame_cond:
+            if not self._frame_cond.wait_for(
+                    lambda: self._latest is not None and self._latest[0] != after_seq, timeout):
+                return 0, 0.0, None, False
+            seq, ts, frame = self._latest
+        _seq, _ts, jpeg = self._raw_cache.get(
+            (width, quality), seq, ts, lambda: self._encode_raw(frame, width, quality))
+        return seq, ts, jpeg, False
+
+    def _send(self, viewers: List[ViewerState], seq: int, ts: float, frame, ai_frame: bool) -> None:
+        now = time.monotonic()
+        for v in viewers:
+            v.adapt(now)
+            if not v.ready(now):
+                continue
+            width, quality = v.tier
+            if ai_frame:
+                # Resized, annotated and encoded once per frame and tier for all viewers
+                _seq, _ts, jpeg = ai_manager.get_encoded_frame(
+                    self.cam_id, width, quality, annotated=True, frame_ref=(seq, ts, frame))
+            else:
+                _seq, _ts, jpeg = self._raw_cache.get(
+                    (width, quality), seq, ts, lambda: self._encode_raw(frame, width, quality))
+            if jpeg is None:
+                continue
+            sent_at = v.on_sent(now)
+            # JPEG goes out as a binary attachment (no base64); seq/ts let clients drop stale frames.
+            # The client's ack drives this viewer's backpressure and tier.
+            socketio.emit('frame', {'cam_id': self.cam_id, 'seq': int(seq), 'ts': float(ts), 'image': jpeg},
+                          to=v.sid, callback=lambda *_a, v=v, t=sent_at: v.on_ack(t))
+            self.frames_sent += 1
 
     def run(self):
         if cv2 is None:
-            socketio.emit('stream_error', {'message': 'OpenCV not installed'}, to=self.sid)
+            socketio.emit('stream_error', {'message': 'OpenCV not installed'}, to=self.room)
             return
         if not self.rtsp_url:
-            socketio.emit('stream_error', {'message': 'Invalid stream source'}, to=self.sid)
+            socketio.emit('stream_error', {'message': 'Invalid stream source'}, to=self.room)
             return
+        src = None
         try:
-            # Read AI/stream preferences once
-            prefs = {
-                'max_width': 960,
-                'jpeg_quality': 70,
-                'annotation_stride': 3,
-                'target_fps': 10,
-            }
-            try:
-                if ai_manager is not None and hasattr(ai_manager, 'get_stream_preferences'):
-                    prefs.update(ai_manager.get_stream_preferences())
-            except Exception:
-                pass
-            target_dt = 1.0 / max(1, int(prefs.get('target_fps', 10)))
-            max_w = int(prefs.get('max_width', 960))
-            jpeg_q = int(prefs.get('jpeg_quality', 70))
-            stride = max(1, int(prefs.get('annotation_stride', 3)))
-            # Determine if AI is running for this camera
-            ai_running = False
-            try:
-                ai_running = bool(ai_manager and hasattr(ai_manager, 'is_camera_running') and ai_manager.is_camera_running(self.cam_id))
-            except Exception:
-                ai_running = False
-            # Set up RTSP source if AI is not running (raw stream)
-            src = None
-            if not ai_running and RTSPFrameSource is not None:
-                try:
-                    src = RTSPFrameSource(self.rtsp_url)
-                    src.open()
-                except Exception:
-                    src = None
+            ai_running = self.ai_running = self._ai_running()
+            next_check = time.monotonic() + self.AI_CHECK_SEC
+            next_open = 0.0
+            last_seq = 0
+            raw_seq = 0
+            next_due = time.monotonic()
             while not self.stop_event.is_set():
-                # Source frame: from AI manager when available, otherwise from RTSP directly
-                frame = None
+                now = time.monotonic()
+                if now >= next_check:
+                    running = self._ai_running()
+                    if running != ai_running:
+                        # AI frames and raw frames are numbered separately
+                        last_seq = 0
+                    ai_running = self.ai_running = running
+                    next_check = now + self.AI_CHECK_SEC
+                frame, seq, ts = None, 0, 0.0
                 if ai_running:
+                    # AI capture owns the camera: never keep a second connection open
+                    if src is not None:
+                        src.close()
+                        src = None
                     try:
-                        if ai_manager is not None and hasattr(ai_manager, 'get_latest_frame'):
-                            frame = ai_manager.get_latest_frame(self.cam_id)
+                        if ai_manager is not None and hasattr(ai_manager, 'wait_new_frame'):
+                            # Block until capture publishes a frame we have not sent yet
+                            seq, ts, frame = ai_manager.wait_new_frame(self.cam_id, last_seq, timeout=0.5)
+                            if frame is not None:
+                                last_seq = seq
                     except Exception:
                         frame = None
                 else:
+                    if src is None and now >= next_open and RTSPFrameSource is not None:
+                        try:
+                            src = RTSPFrameSource(self.rtsp_url)
+                            src.open()
+                        except Exception:
+                            src = None
+                            next_open = now + 5.0
                     if src is not None:
                         try:
                             frame = src.read()
                         except Exception:
                             frame = None
+                    if frame is not None:
+                        raw_seq += 1
+                        seq, ts = raw_seq, time.time()
+                        with self._frame_cond:
+                            self._latest = (seq, ts, frame)
+                            self._frame_cond.notify_all()
                 if frame is None:
                     time.sleep(0.01)
                     continue
-                # Downscale to reduce bandwidth/CPU
-                h, w = frame.shape[:2]
-                if w > max_w:
-                    scale = max_w / float(w)
-                    frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
-                # Decide annotation when AI is running; otherwise send raw frames
-                frame_to_send = frame
-                if ai_running:
-                    self._frame_counter += 1
-                    do_annotate = (self._frame_counter % stride == 0)
-                    if do_annotate and not self.annotate_busy:
-                        def _annotate_job(img: np.ndarray):
-                            try:
-                                out = img
-                                if ai_manager is not None and hasattr(ai_manager, 'annotate_frame'):
-                                    out = ai_manager.annotate_frame(img, self.cam_id)
-                                with self.frame_lock:
-                                    self.last_annotated_frame = out
-                            except Exception:
-                                with self.frame_lock:
-                                    self.last_annotated_frame = img
-                            finally:
-                                self.annotate_busy = False
-                        self.annotate_busy = True
-                        self.annotate_thread = threading.Thread(target=_annotate_job, args=(frame.copy(),), daemon=True)
-                        self.annotate_thread.start()
-                    with self.frame_lock:
-                        if self.last_annotated_frame is not None:
-                            frame_to_send = self.last_annotated_frame
-                ok, buf = cv2.imencode('.jpg', frame_to_send, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_q])
-                if ok:
-                    b64 = base64.b64encode(buf.tobytes()).decode('ascii')
-                    socketio.emit('frame', {'image': b64, 'cam_id': self.cam_id}, to=self.sid)
-                time.sleep(target_dt)
+                viewers = list(self.viewers.values())
+                if viewers:
+                    try:
+                        self._send(viewers, seq, ts, frame, ai_running)
+                    except Exception as e:
+                        print(f"[STREAM] cam {self.cam_id} send error: {e}")
+                del frame
+                # Run at the fastest viewer's rate (listeners pace themselves), on a deadline
+                frame_dt = 1.0 / (max(v.fps for v in viewers) if viewers else self.target_fps)
+                next_due = max(next_due + frame_dt, time.monotonic() - frame_dt)
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    self.stop_event.wait(delay)
         finally:
             try:
-                if 'src' in locals() and src is not None:
+                if src is not None:
                     src.close()
             except Exception:
                 pass
-            socketio.emit('stream_stopped')
 
+    def latest_frame(self) -> Optional[tuple]:
+        """Newest raw frame as (seq, ts, frame), or None before the first one (AI off only)."""
+        with self._frame_cond:
+            return self._latest
+
+    def stats(self) -> Dict[str, Any]:
+        return {'frames_sent': self.frames_sent, 'listeners': self.listeners,
+                'viewers': {sid[:8]: v.stats() for sid, v in list(self.viewers.items())}}
+
+
+# One broadcaster per camera; each browser sid watches at most one camera
+_broadcasters: Dict[int, StreamBroadcaster] = {}
+_stream_cam_by_sid: Dict[str, int] = {}
+_broadcast_lock = threading.Lock()
+
+
+def subscribe_stream(sid: str, cam_id: int, rtsp_url: str, constraints: Optional[Dict[str, Any]] = None) -> None:
+    """Add `sid` (or update its constraints) as a viewer of camera `cam_id`, starting its broadcaster if needed."""
+    join_room(f'stream_cam_{cam_id}', sid=sid)
+    with _broadcast_lock:
+        _stream_cam_by_sid[sid] = cam_id
+        _broadcaster_for(cam_id, rtsp_url).add_viewer(sid, constraints)
+
+
+def _broadcaster_for(cam_id: int, rtsp_url: str) -> StreamBroadcaster:
+    # Caller holds _broadcast_lock
+    bc = _broadcasters.get(cam_id)
+    if bc is None or bc.stop_event.is_set() or not bc.thread.is_alive():
+        # New camera, or its broadcaster ended (e.g. invalid source): start a fresh one
+        bc = _broadcasters[cam_id] = StreamBroadcaster(cam_id, rtsp_url)
+        bc.start()
+    return bc
+
+
+def _release_broadcaster(cam_id: int, bc: StreamBroadcaster) -> None:
+    # Caller holds _broadcast_lock; stops the broadcaster once nobody watches it
+    if not bc.viewers and bc.listeners <= 0:
+        if _broadcasters.get(cam_id) is bc:
+            _broadcasters.pop(cam_id, None)
+        bc.stop()
 
-# Keep workers per client sid
-_workers_by_sid: Dict[str, StreamWorker] = {}
+
+def acquire_stream_listener(cam_id: int, rtsp_url: str) -> StreamBroadcaster:
+    """Register a non-Socket.IO consumer (e.g. MJPEG) of camera `cam_id`; pair with release_stream_listener."""
+    with _broadcast_lock:
+        bc = _broadcaster_for(cam_id, rtsp_url)
+        bc.listeners += 1
+        return bc
+
+
+def release_stream_listener(cam_id: int, bc: StreamBroadcaster) -> None:
+    with _broadcast_lock:
+        bc.listeners -= 1
+        _release_broadcaster(cam_id, bc)
+
+
+def stop_stream_for_sid(sid: Optional[str], notify: bool = True) -> None:
+    """Remove `sid` from the camera it watches; the broadcaster stops with its last viewer."""
+    if not sid:
+        return
+    with _broadcast_lock:
+        cam_id = _stream_cam_by_sid.pop(sid, None)
+        if cam_id is None:
+            return
+        bc = _broadcasters.get(cam_id)
+        if bc is not None:
+            bc.viewers.pop(sid, None)
+            _release_broadcaster(cam_id, bc)
+    try:
+        leave_room(f'stream_cam_{cam_id}', sid=sid)
+        if notify:
+            socketio.emit('stream_stopped', {'cam_id': cam_id}, to=sid)
+    except Exception:
+        pass
+
+
+class MosaicBroadcaster:
+    """Overview of all running cameras as one grid image, composed and encoded once per tick.
+
+    Viewers join the `stream_mosaic` room; a 16-camera overview costs one low-fps encode
+    instead of sixteen camera streams. Tiles come from the AI frame rings, so only cameras
+    with AI running appear; the camera list is refreshed every few seconds.
+    """
+    ROOM = 'stream_mosaic'
+    CAMERA_REFRESH_SEC = 5.0
+
+    def __init__(self):
+        self.viewers: Set[str] = set()
+        self.frames_sent = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='MosaicBroadcaster', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _running_cameras(self):
+        ids, labels = [], {}
+        try:
+            for cid, cam in sorted(load_cameras().items()):
+                if cam.get('stream_enabled', True) and ai_manager.is_camera_running(cid):
+                    ids.append(cid)
+                    labels[cid] = cam.get('name') or f'CAM {cid}'
+        except Exception:
+            pass
+        return ids, labels
+
+    def run(self):
+        if cv2 is None or ai_manager is None or not hasattr(ai_manager, 'compose_mosaic'):
+            socketio.emit('stream_error', {'message': 'Mosaic not available'}, to=self.ROOM)
+            return
+        prefs = {'mosaic_fps': 2.0, 'mosaic_tile_width': 320, 'jpeg_quality': 70}
+        try:
+            prefs.update(ai_manager.get_stream_preferences())
+        except Exception:
+            pass
+        interval = 1.0 / max(0.2, float(prefs.get('mosaic_fps', 2.0)))
+        tile_w = int(prefs.get('mosaic_tile_width', 320))
+        jpeg_q = int(prefs.get('jpeg_quality', 70))
+        ids, labels = [], {}
+        next_refresh = 0.0
+        while not self.stop_event.is_set():
+            t0 = time.monotonic()
+            if t0 >= next_refresh:
+                ids, labels = self._running_cameras()
+                next_refresh = t0 + self.CAMERA_REFRESH_SEC
+            payload = {'ts': time.time(), 'tiles': [], 'image': None}
+            try:
+                canvas, layout = ai_manager.compose_mosaic(ids, tile_w, labels)
+                if canvas is not None:
+                    ok, buf = cv2.imencode('.jpg', canvas, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_q])
+                    if ok:
+                        payload['image'] = buf.tobytes()
+                        payload['tiles'] = layout
+            except Exception as e:
+                print(f"[STREAM] mosaic error: {e}")
+            socketio.emit('mosaic', payload, to=self.ROOM)
+            self.frames_sent += 1
+            self.stop_event.wait(max(0.0, interval - (time.monotonic() - t0)))
+
+
+_mosaic: Optional[MosaicBroadcaster] = None
+
+
+def subscribe_mosaic(sid: str) -> None:
+    """Add `sid` to the mosaic viewers, starting the mosaic broadcaster if needed."""
+    global _mosaic
+    join_room(MosaicBroadcaster.ROOM, sid=sid)
+    with _broadcast_lock:
+        if _mosaic is None or _mosaic.stop_event.is_set() or not _mosaic.thread.is_alive():
+            _mosaic = MosaicBroadcaster()
+            _mosaic.viewers.add(sid)
+            _mosaic.start()
+        else:
+            _mosaic.viewers.add(sid)
+
+
+def stop_mosaic_for_sid(sid: Optional[str]) -> None:
+    """Remove `sid` from the mosaic viewers; the mosaic stops with its last viewer."""
+    global _mosaic
+    if not sid:
+        return
+    with _broadcast_lock:
+        mo = _mosaic
+        if mo is None or sid not in mo.viewers:
+            return
+        mo.viewers.discard(sid)
+        if not mo.viewers:
+            _mosaic = None
+            mo.stop()
+    try:
+        leave_room(MosaicBroadcaster.ROOM, sid=sid)
+    except Exception:
+        pass
+
+
+def stop_all_streams() -> int:
+    """Stop every broadcaster (restart/shutdown); returns how many were running."""
+    global _mosaic
+    with _broadcast_lock:
+        bcs = list(_broadcasters.values())
+        rooms = [(f'stream_cam_{cam_id}', sid) for sid, cam_id in _stream_cam_by_sid.items()]
+        if _mosaic is not None:
+            bcs.append(_mosaic)
+            rooms.extend((MosaicBroadcaster.ROOM, sid) for sid in _mosaic.viewers)
+            _mosaic = None
+        _broadcasters.clear()
+        _stream_cam_by_sid.clear()
+    for bc in bcs:
+        bc.stop()
+    # Dropped viewers must not keep receiving room-wide emits from a later broadcaster.
+    # Runs outside a Socket.IO handler (no request/app context), so use the server directly.
+    for room, sid in rooms:
+        try:
+            socketio.server.leave_room(sid, room, namespace='/')
+        except Exception:
+            pass
+    return len(bcs)
 
 
 @socketio.on('connect')
@@ -2562,7 +2976,8 @@ def on_connect():
 @socketio.on('disconnect')
 def on_disconnect():
     sid = getattr(request, 'sid', None)
-    stop_worker_for_sid(sid)
+    stop_stream_for_sid(sid, notify=False)
+    stop_mosaic_for_sid(sid)
 
 
 # ---- Manage Camera: per-camera toggle & status ----
@@ -2680,14 +3095,6 @@ def on_get_camera_statuses():
         print(f"get_camera_statuses error: {e}")
 
 
-def stop_worker_for_sid(sid: Optional[str]):
-    if not sid:
-        return
-    worker = _workers_by_sid.pop(sid, None)
-    if worker:
-        worker.stop()
-
-
 # request already imported at top
 
 
@@ -2706,8 +3113,10 @@ def start_stream(payload):
         emit('stream_error', {'message': 'Invalid cam_id'})
         return
 
-    # Stop any existing stream for this client
-    stop_worker_for_sid(sid)
+    # Leave the mosaic or any other camera this client was watching
+    stop_mosaic_for_sid(sid)
+    if _stream_cam_by_sid.get(sid) != cam_id:
+        stop_stream_for_sid(sid, notify=False)
 
     # Always load fresh camera config to respect latest stream toggle
     cams_now = load_cameras()
@@ -2718,6 +3127,7 @@ def start_stream(payload):
 
     # Enforce: stream must be enabled
     if not bool(cam.get('stream_enabled', True)):
+        stop_stream_for_sid(sid, notify=False)
         emit('stream_stopped', {'cam_id': cam_id})
         return
     # Enforce: camera AI may or may not be enabled; streaming supports both paths
@@ -2731,10 +3141,10 @@ def start_stream(payload):
         is_running = bool(ai_manager and hasattr(ai_manager, 'is_camera_running') and ai_manager.is_camera_running(cam_id))
     except Exception:
         is_running = False
-    # Create worker even when AI not running (raw RTSP)
-    worker = StreamWorker(sid, cam_id, cam.get('rtsp_url', ''))
-    _workers_by_sid[sid] = worker
-    worker.start()
+    # Join the camera's broadcaster even when AI is not running (raw RTSP).
+    # Optional viewer constraints: max_width, max_quality, max_fps, adaptive
+    constraints = {k: payload.get(k) for k in ('max_width', 'max_quality', 'max_fps', 'adaptive') if k in payload}
+    subscribe_stream(sid, cam_id, cam.get('rtsp_url', ''), constraints)
 
 
 @socketio.on('stop_stream')
@@ -2746,7 +3156,24 @@ def stop_stream(payload=None):
     except Exception:
         pass
     sid = request.sid
-    stop_worker_for_sid(sid)
+    stop_stream_for_sid(sid)
+
+
+@socketio.on('start_mosaic')
+def start_mosaic(payload=None):
+    """Overview of all running cameras in one low-fps `mosaic` event (replaces this client's stream)."""
+    if os.environ.get('APP_STREAM_MODE') == 'rtsp':
+        return
+    sid = request.sid
+    stop_stream_for_sid(sid, notify=False)
+    subscribe_mosaic(sid)
+
+
+@socketio.on('stop_mosaic')
+def stop_mosaic(payload=None):
+    if os.environ.get('APP_STREAM_MODE') == 'rtsp':
+        return
+    stop_mosaic_for_sid(request.sid)
 
 
 # --- AI Tracking Endpoints ---
@@ -2798,6 +3225,25 @@ def api_tracking_reload_embeddings():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/tracking/stats')
+def api_tracking_stats():
+    """Per-camera inference counters (frames processed vs skipped as static), live stream viewers and
+    the attendance capture queue."""
+    if ai_manager is None:
+        return jsonify({'error': 'ai_manager_not_available'}), 500
+    try:
+        stats = ai_manager.get_inference_stats()
+        with _broadcast_lock:
+            stats['streams'] = {str(cid): bc.stats() for cid, bc in _broadcasters.items()}
+            if _mosaic is not None:
+                stats['mosaic'] = {'viewers': len(_mosaic.viewers), 'frames_sent': _mosaic.frames_sent}
+        if _att_capture_service is not None:
+            stats['attendance_captures'] = _att_capture_service.stats()
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # Pass the new employee handler to the AI manager instance
 if ai_manager and hasattr(ai_manager, 'set_new_employee_callback'):
     ai_manager.set_new_employee_callback(_handle_new_employee_seen)
@@ -2901,6 +3347,12 @@ def api_system_restart():
                 except Exception as e:
                     print(f"[RESTART] Failed to emit restart event: {e}")
 
+                # Graceful shutdown: write pending attendance captures while frames are available
+                try:
+                    flush_attendance_captures()
+                except Exception as e:
+                    print(f"[RESTART] Error flushing attendance captures: {e}")
+
                 # Graceful shutdown: Stop AI manager
                 try:
                     if ai_manager is not None and hasattr(ai_manager, 'stop'):
@@ -2910,17 +3362,11 @@ def api_system_restart():
                 except Exception as e:
                     print(f"[RESTART] Error stopping AI manager: {e}")
 
-                # Graceful shutdown: Stop all stream workers
+                # Graceful shutdown: Stop all stream broadcasters
                 try:
-                    if _workers_by_sid:
-                        print(f"[RESTART] Stopping {len(_workers_by_sid)} stream workers...")
-                        for sid, worker in list(_workers_by_sid.items()):
-                            try:
-                                if hasattr(worker, 'stop'):
-                                    worker.stop()
-                            except Exception as e:
-                                print(f"[RESTART] Error stopping worker {sid}: {e}")
-                        print("[RESTART] Stream workers stopped")
+                    stopped = stop_all_streams()
+                    if stopped:
+                        print(f"[RESTART] Stopped {stopped} stream broadcasters")
                 except Exception as e:
                     print(f"[RESTART] Error stopping stream workers: {e}")
 
@@ -2969,20 +3415,20 @@ def api_system_shutdown():
     try:
         def _do_shutdown():
             try:
+                # Write pending attendance captures while frames are available
+                try:
+                    flush_attendance_captures()
+                except Exception:
+                    pass
                 # Stop AI manager if present
                 try:
                     if ai_manager is not None and hasattr(ai_manager, 'stop'):
                         ai_manager.stop()
                 except Exception:
                     pass
-                # Stop all stream workers
+                # Stop all stream broadcasters
                 try:
-                    for sid, worker in list(_workers_by_sid.items()):
-                        try:
-                            if hasattr(worker, 'stop'):
-                                worker.stop()
-                        except Exception:
-                            pass
+                    stop_all_streams()
                 except Exception:
                     pass
                 time.sleep(0.3)
@@ -3033,8 +3479,7 @@ if __name__ == '__main__':
                     allow_unsafe_werkzeug=True)
     except KeyboardInterrupt:
         print("\nMenghentikan server...")
-        # Hentikan semua worker yang berjalan
-        for sid, worker in list(_workers_by_sid.items()):
-            if hasattr(worker, 'stop'):
-                worker.stop()
+        # Simpan capture absensi yang masih antre, lalu hentikan semua broadcaster stream
+        flush_attendance_captures()
+        stop_all_streams()
         sys.exit(0)
\ No newline at end of file
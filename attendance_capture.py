@@ -0,0 +1,260 @@
+"""Background writer for attendance capture photos.
+
+`POST /api/alert_logs` and the new-employee callback (which runs on the
+inference thread) only enqueue a capture request; a single worker thread
+grabs the frame and writes it under
+attendance_captures/YYYY-MM-DD/<emp_id>/ (first_in.jpg / last_out.jpg plus
+meta.json), so neither request latency nor inference waits on the camera,
+the JPEG encode or the disk.
+
+- Requests are keyed by (employee, day, kind) and coalesced while pending:
+  a repeated first_in keeps the earliest request (only upgrading it to an
+  overwrite), a repeated last_out replaces the pending one with the newer
+  event and its due time.
+- A request may carry a delay (`attendance_last_out_delay_sec`); the frame
+  is grabbed when it becomes due, not when it was queued.
+- The queue is bounded; new keys beyond `max_pending` are dropped and counted.
+- Requests due together are written as one batch: image and meta.json files
+  are written to temporary files, fsynced, renamed into place, and each
+  touched directory is fsynced once for the whole batch.
+"""
+import datetime as dt
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+KINDS = ('first_in', 'last_out')
+
+
+def _fsync_dir(path: str) -> None:
+    # Directory fsync makes the renames durable; not supported on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except Exception:
+        return
+    try:
+        os.fsync(fd)
+    except Exception:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _Request:
+    __slots__ = ('key', 'emp_id', 'cam_id', 'ts', 'kind', 'meta', 'overwrite', 'due')
+
+    def __init__(self, key, emp_id, cam_id, ts, kind, meta, overwrite, due):
+        self.key = key
+        self.emp_id = emp_id
+        self.cam_id = cam_id
+        self.ts = ts
+        self.kind = kind
+        self.meta = meta
+        self.overwrite = overwrite
+        self.due = due
+
+
+class AttendanceCaptureService:
+    """Bounded, coalescing queue of attendance captures drained by one writer thread.
+
+    `grab(cam_id)` must return the current frame of a camera as JPEG bytes (or None);
+    `format_ts(ts)` serializes event timestamps for meta.json.
+    """
+
+    def __init__(self, root_dir: str, grab: Callable[[int], Optional[bytes]],
+                 format_ts: Optional[Callable[[dt.datetime], Optional[str]]] = None,
+                 max_pending: int = 64, batch_window_sec: float = 0.2):
+        self.root_dir = root_dir
+        self.grab = grab
+        self.format_ts = format_ts or (lambda ts: ts.isoformat())
+        self.max_pending = max(1, int(max_pending))
+        self.batch_window_sec = max(0.0, float(batch_window_sec))
+        self._pending: Dict[Tuple[int, str, str], _Request] = {}
+        self._heap: List[Tuple[float, int, Tuple[int, str, str]]] = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name='attendance-capture', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def day_of(ts: Optional[dt.datetime]) -> str:
+        return (ts.date() if isinstance(ts, dt.datetime) else dt.date.today()).isoformat()
+
+    def submit(self, emp_id: int, cam_id: int, ts: dt.datetime, kind: str, meta: Optional[Dict[str, Any]] = None,
+               overwrite: bool = False, delay_sec: float = 0.0) -> bool:
+        """Queue a capture; returns False if it was dropped (queue full, stopped or bad kind)."""
+        if kind not in KINDS:
+            return False
+        emp_id, cam_id = int(emp_id), int(cam_id)
+        key = (emp_id, self.day_of(ts), kind)
+        due = time.monotonic() + max(0.0, float(delay_sec or 0.0))
+        with self._cond:
+            if self._stopped:
+                return False
+            cur = self._pending.get(key)
+            if cur is not None:
+                self.coalesced += 1
+                if kind == 'first_in':
+                    cur.overwrite = cur.overwrite or bool(overwrite)
+                    return True
+                # last_out: the newer exit wins, including its delay
+                cur.cam_id, cur.ts, cur.meta, cur.due = cam_id, ts, dict(meta or {}), due
+                heapq.heappush(self._heap, (due, next(self._order), key))
+                self._cond.notify()
+                return True
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                print(f"[attendance] capture queue full, dropping {kind}: emp={emp_id} cam={cam_id}")
+                return False
+            self._pending[key] = _Request(key, emp_id, cam_id, ts, kind, dict(meta or {}), bool(overwrite), due)
+            heapq.heappush(self._heap, (due, next(self._order), key))
+            self.queued += 1
+            self._cond.notify()
+            return True
+
+    def _take_due(self) -> List[_Request]:
+        """Block until at least one request is due, then return every request due within the batch window."""
+        with self._cond:
+            while True:
+                # Drop heap entries superseded by a coalesced last_out or already taken
+                while self._heap:
+                    due, _, key = self._heap[0]
+                    req = self._pending.get(key)
+                    if req is not None and req.due == due:
+                        break
+                    heapq.heappop(self._heap)
+                if self._stopped and not self._heap:
+                    return []
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait > 0 and not self._stopped:
+                    self._cond.wait(wait)
+                    continue
+                break
+        if self.batch_window_sec > 0 and not self._stopped:
+            time.sleep(self.batch_window_sec)
+        batch: List[_Request] = []
+        with self._cond:
+            horizon = float('inf') if self._stopped else time.monotonic()
+            while self._heap and self._heap[0][0] <= horizon:
+                due, _, key = heapq.heappop(self._heap)
+                req = self._pending.get(key)
+                if req is not None and req.due == due:
+                    batch.append(self._pending.pop(key))
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_due()
+            if not batch:
+                if self._stopped:
+                    return
+                continue
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[_Request]) -> None:
+        staged: List[Tuple[str, str, Optional[str]]] = []  # (tmp path, final path, log line for images)
+        metas: Dict[str, Dict[str, Any]] = {}
+        settled = 0  # requests already counted as skipped, failed or written
+        try:
+            for req in batch:
+                day = req.key[1]
+                root = os.path.join(self.root_dir, day, str(req.emp_id))
+                fname = f'{req.kind}.jpg'
+                target = os.path.join(root, fname)
+                # Strict write-once for FIRST IN unless overwrite is forced
+                if req.kind == 'first_in' and not req.overwrite and os.path.isfile(target):
+                    self.skipped += 1
+                    settled += 1
+                    print(f"[attendance] skip first_in: already exists for emp={req.emp_id} day={day}")
+                    continue
+                try:
+                    img = self.grab(req.cam_id)
+                except Exception:
+                    img = None
+                if not img:
+                    self.failed += 1
+                    settled += 1
+                    print(f"[attendance] no frame for {req.kind}: emp={req.emp_id} cam={req.cam_id}")
+                    continue
+                os.makedirs(root, exist_ok=True)
+                tmp = target + '.tmp'
+                staged.append((tmp, target, f"{req.kind}: emp={req.emp_id} cam={req.cam_id} day={day} file={target}"))
+                with open(tmp, 'wb') as f:
+                    f.write(img)
+                meta = metas.get(root)
+                if meta is None:
+                    meta = {}
+                    try:
+                        meta_path = os.path.join(root, 'meta.json')
+                        if os.path.isfile(meta_path):
+                            with open(meta_path, 'r', encoding='utf-8') as mf:
+                                meta = json.load(mf) or {}
+                    except Exception:
+                        meta = {}
+                    metas[root] = meta
+                meta[req.kind] = {
+                    'ts': self.format_ts(req.ts) if isinstance(req.ts, dt.datetime) else None,
+                    'cam_id': req.cam_id,
+                    'cam_name': req.meta.get('name'),
+                    'cam_area': req.meta.get('area'),
+                    'file': fname,
+                }
+            for root, meta in metas.items():
+                meta_path = os.path.join(root, 'meta.json')
+                staged.append((meta_path + '.tmp', meta_path, None))
+                with open(meta_path + '.tmp', 'w', encoding='utf-8') as mf:
+                    json.dump(meta, mf, indent=2)
+            if not staged:
+                return
+            # One fsync per file and per directory for the whole batch, then atomic renames
+            for tmp, _, _ in staged:
+                with open(tmp, 'rb+') as f:
+                    os.fsync(f.fileno())
+            for tmp, final, saved in staged:
+                os.replace(tmp, final)
+                if saved is not None:
+                    self.written += 1
+                    settled += 1
+                    print(f"[attendance] saved {saved}")
+            for root in {os.path.dirname(final) for _, final, _ in staged}:
+                _fsync_dir(root)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch) - settled
+            print(f"[attendance] capture batch failed: {e}")
+        finally:
+            # Nothing half-written is left next to first_in.jpg / last_out.jpg / meta.json
+            for tmp, _, _ in staged:
+                try:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                except Exception:
+                    pass
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write whatever is still queued (ignoring delays) and stop the worker."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._pending)
+        return {'pending': pending, 'queued': self.queued, 'coalesced': self.coalesced, 'dropped': self.dropped,
+                'written': self.written, 'skipped': self.skipped, 'failed': self.failed, 'batches': self.batches}
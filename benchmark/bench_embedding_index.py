@@ -0,0 +1,116 @@
+"""
+Benchmark the approximate (IVF) embedding index against exact brute-force search.
+
+Builds a synthetic gallery shaped like a real enrollment (several pose templates
+per employee around a per-person identity vector), then checks that for every
+query whose exact best match clears `embedding_similarity_threshold`, the IVF
+index returns the same employee. Also reports per-batch latency of both.
+
+Usage:
+    python benchmark/bench_embedding_index.py --employees 10000 --templates 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from embedding_index import ExactIndex, IVFIndex
+
+
+def _load_threshold() -> float:
+    try:
+        with open(os.path.join(BASE_DIR, 'config', 'parameter_config.json'), 'r', encoding='utf-8') as f:
+            return float(json.load(f).get('embedding_similarity_threshold', 0.55))
+    except Exception:
+        return 0.55
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-8)).astype('float32')
+
+
+def build_gallery(rng, employees: int, templates: int, dim: int, pose_noise: float):
+    identities = _normalize(rng.normal(size=(employees, dim)))
+    rows = identities[:, None, :] + pose_noise * rng.normal(size=(employees, templates, dim)) / np.sqrt(dim)
+    gallery = _normalize(rows.reshape(employees * templates, dim))
+    row_seg = np.repeat(np.arange(employees), templates).astype('int64')
+    seg_starts = (np.arange(employees) * templates).astype('int64')
+    return identities, gallery, row_seg, seg_starts
+
+
+def make_queries(rng, identities: np.ndarray, count: int, query_noise: float, impostor_frac: float):
+    employees, dim = identities.shape
+    truth = rng.integers(0, employees, size=count)
+    q = identities[truth] + query_noise * rng.normal(size=(count, dim)) / np.sqrt(dim)
+    impostors = rng.random(count) < impostor_frac
+    q[impostors] = rng.normal(size=(int(impostors.sum()), dim))
+    return _normalize(q)
+
+
+def _timed_scores(index, queries: np.ndarray, batch: int):
+    out = []
+    t0 = time.perf_counter()
+    for i in range(0, queries.shape[0], batch):
+        out.append(index.employee_scores(queries[i:i + batch]))
+    elapsed = time.perf_counter() - t0
+    return np.vstack(out), elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--employees', type=int, default=10000)
+    ap.add_argument('--templates', type=int, default=5)
+    ap.add_argument('--dim', type=int, default=512)
+    ap.add_argument('--queries', type=int, default=2000)
+    ap.add_argument('--batch', type=int, default=16, help='faces per frame')
+    ap.add_argument('--nlist', type=int, default=0)
+    ap.add_argument('--nprobe', type=int, default=8)
+    ap.add_argument('--pose-noise', type=float, default=0.5)
+    ap.add_argument('--query-noise', type=float, default=0.8)
+    ap.add_argument('--impostor-frac', type=float, default=0.2)
+    ap.add_argument('--threshold', type=float, default=None)
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+
+    thresh = args.threshold if args.threshold is not None else _load_threshold()
+    rng = np.random.default_rng(args.seed)
+    identities, gallery, row_seg, seg_starts = build_gallery(rng, args.employees, args.templates, args.dim, args.pose_noise)
+    queries = make_queries(rng, identities, args.queries, args.query_noise, args.impostor_frac)
+
+    exact = ExactIndex().build(gallery, row_seg, seg_starts)
+    t0 = time.perf_counter()
+    ivf = IVFIndex(nlist=args.nlist, nprobe=args.nprobe, min_rows=0, seed=args.seed).build(gallery, row_seg, seg_starts)
+    build_s = time.perf_counter() - t0
+
+    ex_scores, ex_s = _timed_scores(exact, queries, args.batch)
+    ivf_scores, ivf_s = _timed_scores(ivf, queries, args.batch)
+
+    ex_best = ex_scores.argmax(axis=1)
+    ex_sim = ex_scores.max(axis=1)
+    ivf_best = ivf_scores.argmax(axis=1)
+    accepted = ex_sim >= thresh
+    agree = (ex_best == ivf_best) & accepted
+    n_acc = int(accepted.sum())
+    recall = float(agree.sum()) / n_acc if n_acc else 1.0
+    # An approximate miss must never turn into a wrong accepted identity
+    false_accepts = int(((ivf_best != ex_best) & (ivf_scores.max(axis=1) >= thresh)).sum())
+
+    batches = max(1, (args.queries + args.batch - 1) // args.batch)
+    print(f"Gallery: {args.employees} employees x {args.templates} templates = {gallery.shape[0]} rows, dim={args.dim}")
+    print(f"IVF: nlist={ivf.centroids.shape[0]} nprobe={ivf.nprobe} build={build_s:.2f}s")
+    print(f"Queries: {args.queries} (batch={args.batch}), accepted by exact @ {thresh:.2f}: {n_acc}")
+    print(f"Exact: {1000.0 * ex_s / batches:.2f} ms/batch")
+    print(f"IVF:   {1000.0 * ivf_s / batches:.2f} ms/batch  (speedup x{ex_s / max(ivf_s, 1e-9):.1f})")
+    print(f"Same employee as exact above threshold: {recall * 100.0:.2f}%  false accepts: {false_accepts}")
+    return 0 if recall >= 0.99 and false_accepts == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
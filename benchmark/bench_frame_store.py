@@ -0,0 +1,186 @@
+"""
+Benchmark frame hand-off between capture, inference and streaming.
+
+In-process, compares the old pattern (dict of frames behind a lock, copied on
+write and on every read) with `FrameRing` and the shared-memory
+`SharedFrameStore` ring: one writer publishes frames while several readers
+fetch the newest one, as the inference thread and stream workers do.
+
+Cross-process, a child process consumes frames either from a
+multiprocessing.Queue (frames pickled through a pipe) or from a
+`SharedFrameReader` attached to the store's segment, and reports frames
+received and end-to-end latency.
+
+Usage:
+    python benchmark/bench_frame_store.py --width 1920 --height 1080 --frames 300 --readers 3
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from frame_store import FrameRing, SharedFrameReader, SharedFrameStore
+
+
+class DictStore:
+    """The pre-ring pattern: latest frame per camera in a dict, copied in and out under a lock."""
+
+    def __init__(self):
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def write(self, cam_id, frame):
+        with self._lock:
+            self._frames[cam_id] = frame.copy()
+
+    def read(self, cam_id):
+        with self._lock:
+            frm = self._frames.get(cam_id)
+            return None if frm is None else frm.copy()
+
+
+def _make_frames(width: int, height: int, count: int = 8):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def _run_in_process(name, write, read, frames, n_frames, readers):
+    stop = threading.Event()
+    reads = [0] * readers
+
+    def reader(k):
+        while not stop.is_set():
+            frm = read()
+            if frm is not None:
+                reads[k] += 1
+                _ = frm[0, 0, 0]
+            time.sleep(0)
+
+    threads = [threading.Thread(target=reader, args=(k,), daemon=True) for k in range(readers)]
+    for th in threads:
+        th.start()
+    t0 = time.perf_counter()
+    for i in range(n_frames):
+        write(frames[i % len(frames)])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for th in threads:
+        th.join()
+    print(f"  {name:<18} write {1e6 * elapsed / n_frames:8.1f} us/frame   reads {sum(reads) / elapsed:10.0f}/s")
+
+
+def _queue_consumer(q, result):
+    got, lat = 0, 0.0
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        ts, frame = item
+        _ = frame[0, 0, 0]
+        lat += time.time() - ts
+        got += 1
+    result.put((got, lat))
+
+
+def _shm_consumer(name: str) -> int:
+    # Runs as a separate interpreter (like the inference workers) so it has its own resource tracker;
+    # stops when the writer closes the ring and marks the segment as moved
+    reader = SharedFrameReader(name)
+    seq = reader.latest()[0]  # the priming frame is not counted
+    print('ready', flush=True)
+    got, lat = 0, 0.0
+    while not reader.moved:
+        s, ts, frame = reader.latest(seq)
+        if frame is None:
+            time.sleep(0.0005)
+            continue
+        seq = s
+        lat += time.time() - ts
+        got += 1
+    reader.close()
+    print(got, lat, flush=True)
+    return 0
+
+
+def _run_cross_process(frames, n_frames, fps):
+    ctx = mp.get_context('spawn')
+    interval = 1.0 / fps if fps > 0 else 0.0
+
+    q, result = ctx.Queue(maxsize=4), ctx.Queue()
+    proc = ctx.Process(target=_queue_consumer, args=(q, result))
+    proc.start()
+    t0 = time.perf_counter()
+    for i in range(n_frames):
+        q.put((time.time(), frames[i % len(frames)]))
+        if interval:
+            time.sleep(interval)
+    q.put(None)
+    got, lat = result.get()
+    elapsed = time.perf_counter() - t0
+    proc.join()
+    print(f"  {'mp.Queue':<18} {got}/{n_frames} frames   {1e3 * lat / max(got, 1):7.2f} ms latency   {elapsed:.2f}s")
+
+    store = SharedFrameStore(6)
+    ring = store.ring(0)
+    ring.write(frames[0])
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--reader', ring.segment_name],
+                            stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # attached
+    t0 = time.perf_counter()
+    for i in range(n_frames):
+        ring.write(frames[i % len(frames)], ts=time.time())
+        if interval:
+            time.sleep(interval)
+    time.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    store.close()
+    got, lat = proc.stdout.readline().split()
+    got, lat = int(got), float(lat)
+    proc.wait()
+    print(f"  {'SharedFrameReader':<18} {got}/{n_frames} frames   {1e3 * lat / max(got, 1):7.2f} ms latency   {elapsed:.2f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--width', type=int, default=1280)
+    ap.add_argument('--height', type=int, default=720)
+    ap.add_argument('--frames', type=int, default=300)
+    ap.add_argument('--readers', type=int, default=3, help='reader threads (inference + stream workers)')
+    ap.add_argument('--fps', type=float, default=30.0, help='writer rate for the cross-process test (0 = unpaced)')
+    ap.add_argument('--skip-processes', action='store_true')
+    ap.add_argument('--reader', metavar='SEGMENT', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.reader:
+        return _shm_consumer(args.reader)
+
+    frames = _make_frames(args.width, args.height)
+    print(f"Frames: {args.width}x{args.height}x3 ({frames[0].nbytes / 1e6:.1f} MB), {args.frames} writes, {args.readers} readers")
+
+    print("In-process:")
+    legacy = DictStore()
+    _run_in_process('dict + copy', lambda f: legacy.write(0, f), lambda: legacy.read(0),
+                    frames, args.frames, args.readers)
+    ring = FrameRing(4)
+    _run_in_process('FrameRing', ring.write, lambda: ring.latest()[2], frames, args.frames, args.readers)
+    store = SharedFrameStore(6)
+    shared = store.ring(0)
+    _run_in_process('SharedFrameStore', shared.write, lambda: shared.latest()[2], frames, args.frames, args.readers)
+    store.close()
+
+    if not args.skip_processes:
+        print(f"Cross-process (writer at {args.fps:g} fps):")
+        _run_cross_process(frames, args.frames, args.fps)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""Video capture backends for camera sources.
+
+`open_capture(src, cfg)` picks a backend from parameter_config.json:
+  - GStreamer (OpenCV built with GStreamer): rtspsrc honoring `rtsp_protocol`,
+    `rtsp_codec` and `gst_latency_ms`, hardware decoders picked by decodebin,
+    `videorate` dropping frames above the target fps before color conversion,
+    and `appsink drop=true max-buffers=1` so only the newest frame is kept.
+  - PyAV: RTSP over `rtsp_transport` (default tcp, like the OpenCV fallback);
+    a reader thread demuxes/decodes continuously and keeps only the newest
+    decoded frame; BGR conversion happens only for frames actually read.
+    Non-reference frames are skipped in the decoder when the source runs
+    faster than the target fps.
+  - OpenCV (fallback, and always for webcams): plain VideoCapture; live
+    sources are drained by a grab() thread and only retrieve() the frames read.
+
+Every backend exposes the VideoCapture subset used by the tracker:
+`isOpened()`, `read() -> (ok, frame)` and `release()`. For live sources,
+`read()` returns the newest frame not yet returned (waiting briefly for one).
+Files are read sequentially so they can stand in for a camera in tests.
+
+With `max_width` (`capture_max_width`), `read()` returns a working frame no
+wider than that; PyAV scales during its YUV->BGR conversion so the full-size
+BGR image never exists. `full_frame()` returns the most recent frame at source
+resolution, converted only when asked for (e.g. attendance captures).
+
+Smoke test against a file or a local RTSP server:
+    python capture.py sample.mp4 --backend pyav --frames 100
+    python capture.py rtsp://127.0.0.1:8554/cam --backend gstreamer
+"""
+import os
+import sys
+import time
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+import cv2
+
+try:
+    import av  # PyAV, optional
+except Exception:
+    av = None
+
+BACKENDS = ('auto', 'gstreamer', 'pyav', 'opencv')
+
+
+def _is_webcam(src: str) -> bool:
+    return src.isdigit() or src.lower().startswith('webcam:')
+
+
+def _is_live(src: str) -> bool:
+    s = src.lower()
+    return _is_webcam(src) or s.startswith(('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://'))
+
+
+def _fit_width(frame: Optional[np.ndarray], max_width: int) -> Optional[np.ndarray]:
+    if frame is None or not max_width:
+        return frame
+    h, w = frame.shape[:2]
+    if w <= max_width:
+        return frame
+    return cv2.resize(frame, (max_width, max(1, int(round(h * max_width / float(w))))), interpolation=cv2.INTER_AREA)
+
+
+def gstreamer_available() -> bool:
+    try:
+        for line in cv2.getBuildInformation().splitlines():
+            if 'GStreamer' in line:
+                return 'YES' in line
+    except Exception:
+        pass
+    return False
+
+
+class _LatestFrame:
+    """Single-slot handoff between a reader thread and read()."""
+
+    def __init__(self, drop: bool):
+        self.drop = drop
+        self._cond = threading.Condition()
+        self._item = None
+        self._fresh = False
+        self.closed = False
+
+    def put(self, item) -> None:
+        with self._cond:
+            if not self.drop:
+                # Sequential sources (files): wait until the consumer took the previous frame
+                while self._fresh and not self.closed:
+                    self._cond.wait(0.5)
+            self._item = item
+            self._fresh = True
+            self._cond.notify_all()
+
+    def take(self, timeout: float):
+        with self._cond:
+            if not self._fresh and not self.closed:
+                self._cond.wait(timeout)
+            if not self._fresh:
+                return None
+            self._fresh = False
+            self._cond.notify_all()
+            return self._item
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class OpenCVCapture:
+    name = 'opencv'
+
+    def __init__(self, src: str, rtsp_protocol: str = 'tcp', read_timeout: float = 2.0, max_width: int = 0):
+        self.src = src
+        self.rtsp_protocol = rtsp_protocol
+        self.read_timeout = read_timeout
+        self.max_width = int(max_width or 0)
+        self._cap = None
+        self._slot: Optional[_LatestFrame] = None
+        self._thread: Optional[threading.Thread] = None
+        self._cap_lock = threading.Lock()
+
+    def open(self) -> bool:
+        s = self.src
+        if s.lower().startswith('rtsp://'):
+            os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', f'rtsp_transport;{self.rtsp_protocol}|stimeout;5000000|buffer_size;102400')
+        if s.lower().startswith('webcam:'):
+            cap = cv2.VideoCapture(int(s.split(':', 1)[1]), getattr(cv2, 'CAP_DSHOW', 0))
+        elif s.isdigit():
+            cap = cv2.VideoCapture(int(s), getattr(cv2, 'CAP_DSHOW', 0))
+        else:
+            cap = cv2.VideoCapture(s)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if _is_webcam(s):
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self._cap = cap
+        if not cap.isOpened():
+            return False
+        if _is_live(s) and not _is_webcam(s):
+            # Keep the network buffer drained; decode to BGR only on read()
+            self._slot = _LatestFrame(drop=True)
+            self._thread = threading.Thread(target=self._grab_loop, name='capture-grab', daemon=True)
+            self._thread.start()
+        return True
+
+    def _grab_loop(self):
+        while not self._slot.closed:
+            with self._cap_lock:
+                ok = self._cap.grab()
+            if not ok:
+                self._slot.close()
+                break
+            self._slot.put(True)
+
+    def isOpened(self) -> bool:
+        return bool(self._cap is not None and self._cap.isOpened() and not (self._slot and self._slot.closed))
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._cap is None:
+            return False, None
+        if self._slot is None:
+            with self._cap_lock:
+                ok, frame = self._cap.read()
+        else:
+            if self._slot.take(self.read_timeout) is None:
+                return False, None
+            with self._cap_lock:
+                ok, frame = self._cap.retrieve()
+        return ok, _fit_width(frame, self.max_width) if ok else frame
+
+    def full_frame(self) -> Optional[np.ndarray]:
+        """Convert the current decoder frame again at source resolution."""
+        if self._cap is None:
+            return None
+        with self._cap_lock:
+            ok, frame = self._cap.retrieve()
+        return frame if ok else None
+
+    def release(self):
+        if self._slot is not None:
+            self._slot.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._cap is not None:
+            self._cap.release()
+
+
+class GStreamerCapture:
+    name = 'gstreamer'
+
+    def __init__(self, src: str, rtsp_protocol: str = 'tcp', rtsp_codec: str = 'h264', latency_ms: int = 100,
+                 max_fps: Optional[float] = None, max_width: int = 0):
+        self.src = src
+        self.rtsp_protocol = rtsp_protocol
+        self.rtsp_codec = rtsp_codec
+        self.latency_ms = latency_ms
+        self.max_fps = max_fps
+        self.max_width = int(max_width or 0)
+        self._cap = None
+        # appsink hands out full-size BGR; the last one is kept for full_frame()
+        self._last_full: Optional[np.ndarray] = None
+
+    def pipeline(self) -> str:
+        s = self.src
+        if s.lower().startswith('rtsp://'):
+            codec = 'h265' if self.rtsp_codec in ('h265', 'hevc') else 'h264'
+            head = (f'rtspsrc location="{s}" protocols={self.rtsp_protocol} latency={int(self.latency_ms)} drop-on-latency=true '
+                    f'! rtp{codec}depay ! {codec}parse ! decodebin')
+        else:
+            uri = s if '://' in s else 'file://' + os.path.abspath(s).replace(os.sep, '/')
+            head = f'uridecodebin uri="{uri}"'
+        rate = ''
+        if self.max_fps and _is_live(s):
+            rate = f' ! videorate drop-only=true max-rate={max(1, int(round(self.max_fps)))}'
+        sink = 'appsink drop=true max-buffers=1 sync=false' if _is_live(s) else 'appsink sync=false'
+        return f'{head}{rate} ! videoconvert ! video/x-raw,format=BGR ! {sink}'
+
+    def open(self) -> bool:
+        if _is_webcam(self.src) or not gstreamer_available():
+            return False
+        self._cap = cv2.VideoCapture(self.pipeline(), cv2.CAP_GSTREAMER)
+        return self._cap.isOpened()
+
+    def isOpened(self) -> bool:
+        return bool(self._cap is not None and self._cap.isOpened())
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._cap is None:
+            return False, None
+        ok, frame = self._cap.read()
+        if not ok:
+            return ok, frame
+        self._last_full = frame
+        return ok, _fit_width(frame, self.max_width)
+
+    def full_frame(self) -> Optional[np.ndarray]:
+        frame = self._last_full
+        return frame.copy() if frame is not None else None
+
+    def release(self):
+        self._last_full = None
+        if self._cap is not None:
+            self._cap.release()
+
+
+class PyAVCapture:
+    name = 'pyav'
+
+    def __init__(self, src: str, rtsp_protocol: str = 'tcp', max_fps: Optional[float] = None, read_timeout: float = 2.0,
+                 max_width: int = 0):
+        self.src = src
+        self.rtsp_protocol = rtsp_protocol
+        self.max_fps = max_fps
+        self.read_timeout = read_timeout
+        self.max_width = int(max_width or 0)
+        self._container = None
+        self._last = None  # last decoded (YUV) frame handed out by read()
+        self._slot: Optional[_LatestFrame] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self) -> bool:
+        if av is None or _is_webcam(self.src):
+            return False
+        options = {}
+        if self.src.lower().startswith('rtsp://'):
+            options = {'rtsp_transport': self.rtsp_protocol, 'fflags': 'nobuffer', 'flags': 'low_delay', 'stimeout': '5000000'}
+        try:
+            self._container = av.open(self.src, options=options, timeout=5.0)
+            stream = self._container.streams.video[0]
+        except Exception as e:
+            print(f"[CAP] PyAV open failed for {self.src}: {e}")
+            self.release()
+            return False
+        stream.thread_type = 'AUTO'
+        try:
+            rate = float(stream.average_rate or 0)
+        except Exception:
+            rate = 0.0
+        if self.max_fps and rate > self.max_fps * 1.5:
+            # Frames nobody else references can be dropped before they are decoded
+            stream.codec_context.skip_frame = 'NONREF'
+        self._slot = _LatestFrame(drop=_is_live(self.src))
+        self._thread = threading.Thread(target=self._decode_loop, args=(stream,), name='capture-pyav', daemon=True)
+        self._thread.start()
+        return True
+
+    def _decode_loop(self, stream):
+        try:
+            for frame in self._container.decode(stream):
+                if self._slot.closed:
+                    break
+                self._slot.put(frame)
+        except Exception as e:
+            if not self._slot.closed:
+                print(f"[CAP] PyAV decode stopped for {self.src}: {e}")
+        finally:
+            self._slot.close()
+
+    def isOpened(self) -> bool:
+        return bool(self._container is not None and self._slot is not None and not self._slot.closed)
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._slot is None:
+            return False, None
+        frame = self._slot.take(self.read_timeout)
+        if frame is None:
+            return False, None
+        self._last = frame
+        if self.max_width and frame.width > self.max_width:
+            # Scale inside the colorspace conversion: one swscale pass, no full-size BGR buffer
+            height = max(2, int(round(frame.height * self.max_width / float(frame.width))) // 2 * 2)
+            return True, frame.to_ndarray(width=self.max_width, height=height, format='bgr24')
+        return True, frame.to_ndarray(format='bgr24')
+
+    def full_frame(self) -> Optional[np.ndarray]:
+        frame = self._last
+        return frame.to_ndarray(format='bgr24') if frame is not None else None
+
+    def release(self):
+        self._last = None
+        if self._slot is not None:
+            self._slot.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._container is not None:
+            try:
+                self._container.close()
+            except Exception:
+                pass
+
+
+def open_capture(src: str, cfg: Optional[dict] = None, backend: Optional[str] = None, max_fps: Optional[float] = None,
+                 max_width: Optional[int] = None):
+    """Open `src` with the configured backend, falling back to OpenCV. Returns None if nothing opens.
+
+    `max_width` defaults to `capture_max_width` from cfg; pass 0 for full-resolution frames.
+    """
+    cfg = cfg or {}
+    s = str(src or '').strip()
+    kind = str(backend or cfg.get('capture_backend', 'auto') or 'auto').strip().lower()
+    if kind not in BACKENDS:
+        print(f"[CAP] Unknown capture_backend '{kind}', using auto")
+        kind = 'auto'
+    proto = str(cfg.get('rtsp_protocol', 'tcp') or 'tcp').strip().lower()
+    proto = proto if proto in ('tcp', 'udp') else 'tcp'
+    # FFmpeg-based backends (PyAV, OpenCV) have always connected over TCP; `rtsp_protocol` is
+    # GStreamer-only so switching it to udp for rtspsrc does not move them to lossy UDP
+    transport = str(cfg.get('rtsp_transport', 'tcp') or 'tcp').strip().lower()
+    transport = transport if transport in ('tcp', 'udp') else 'tcp'
+    codec = str(cfg.get('rtsp_codec', 'h264') or 'h264').strip().lower()
+    latency = int(cfg.get('gst_latency_ms', 100))
+    if max_fps is None:
+        max_fps = float(cfg.get('fps_target', 0) or 0) or None
+    if max_width is None:
+        max_width = int(cfg.get('capture_max_width', 0) or 0)
+
+    candidates = []
+    if kind == 'gstreamer' or (kind == 'auto' and bool(cfg.get('use_gstreamer_rtsp', False)) and s.lower().startswith('rtsp://')):
+        candidates.append(lambda: GStreamerCapture(s, proto, codec, latency, max_fps, max_width=max_width))
+    if kind == 'pyav' or (kind == 'auto' and s.lower().startswith('rtsp://')):
+        candidates.append(lambda: PyAVCapture(s, transport, max_fps, max_width=max_width))
+    candidates.append(lambda: OpenCVCapture(s, transport, max_width=max_width))
+
+    for make in candidates:
+        cap = make()
+        try:
+            if cap.open():
+                return cap
+        except Exception as e:
+            print(f"[CAP] {cap.name} backend failed for {s}: {e}")
+        cap.release()
+        if cap.name != 'opencv':
+            print(f"[CAP] {cap.name} backend unavailable for {s}, trying next")
+    return None
+
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description='Read frames from a source and report throughput.')
+    ap.add_argument('src', help='RTSP URL, video file or webcam index')
+    ap.add_argument('--backend', default='auto', choices=BACKENDS)
+    ap.add_argument('--frames', type=int, default=100)
+    ap.add_argument('--fps', type=float, default=None, help='target fps (default: fps_target from parameter_config.json)')
+    ap.add_argument('--max-width', type=int, default=None, help='working frame width (default: capture_max_width, 0 = full size)')
+    args = ap.parse_args(argv)
+
+    cfg = {}
+    try:
+        import json
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'parameter_config.json'), 'r', encoding='utf-8') as f:
+            cfg = json.load(f)
+    except Exception:
+        pass
+    cap = open_capture(args.src, cfg, backend=args.backend, max_fps=args.fps, max_width=args.max_width)
+    if cap is None:
+        print(f"Unable to open {args.src}")
+        return 1
+    n = 0
+    shape = None
+    t0 = time.perf_counter()
+    try:
+        while n < args.frames:
+            ok, frame = cap.read()
+            if not ok or frame is None:
+                break
+            shape = frame.shape
+            n += 1
+    finally:
+        cap.release()
+    dt_s = time.perf_counter() - t0
+    print(f"backend={cap.name} frames={n} shape={shape} elapsed={dt_s:.2f}s fps={n / max(dt_s, 1e-9):.1f}")
+    return 0 if n > 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
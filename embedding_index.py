@@ -0,0 +1,139 @@
+"""Search indexes for the face embedding gallery.
+
+Both indexes work on the L2-normalized gallery matrix built by
+`module_AI.EmbeddingStore` and return, for a batch of normalized queries, a
+(N, employees) matrix holding the best template similarity per employee.
+Employees that an approximate index did not visit get a score of -1.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+
+class ExactIndex:
+    """Brute-force cosine search: one GEMM over every template."""
+    kind = 'exact'
+
+    def __init__(self):
+        self.gallery = np.zeros((0, 0), dtype='float32')
+        self.seg_starts = np.zeros((0,), dtype='int64')
+
+    def build(self, gallery: np.ndarray, row_seg: np.ndarray, seg_starts: np.ndarray, previous=None):
+        self.gallery = gallery
+        self.seg_starts = seg_starts
+        return self
+
+    def employee_scores(self, Q: np.ndarray) -> np.ndarray:
+        sims = Q @ self.gallery.T  # (N, templates)
+        return np.maximum.reduceat(sims, self.seg_starts, axis=1)
+
+
+class IVFIndex:
+    """Inverted-file index with a spherical k-means coarse quantizer (NumPy only).
+
+    Templates are bucketed by their nearest centroid; a query only scores the
+    templates of its `nprobe` closest buckets. Galleries smaller than
+    `min_rows` are searched exactly, where brute force is already cheap.
+    """
+    kind = 'ivf'
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8, min_rows: int = 5000, train_iters: int = 10, seed: int = 0):
+        self.nlist = int(nlist)
+        self.nprobe = max(1, int(nprobe))
+        self.min_rows = max(0, int(min_rows))
+        self.train_iters = max(1, int(train_iters))
+        self.seed = int(seed)
+        self.exact = ExactIndex()
+        self.use_exact = True
+        self.gallery = np.zeros((0, 0), dtype='float32')
+        self.row_seg = np.zeros((0,), dtype='int64')
+        self.n_seg = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_rows = 0
+        self.list_rows = np.zeros((0,), dtype='int64')
+        self.list_starts = np.zeros((1,), dtype='int64')
+
+    def _train(self, gallery: np.ndarray, nlist: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        m = gallery.shape[0]
+        # Train on a bounded sample; assignment of all rows happens afterwards
+        sample = gallery if m <= nlist * 256 else gallery[rng.choice(m, nlist * 256, replace=False)]
+        cent = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            assign = np.argmax(sample @ cent.T, axis=1)
+            sums = np.zeros_like(cent)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty buckets so every list stays useful
+                sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+            cent = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-8)
+        return np.ascontiguousarray(cent, dtype='float32')
+
+    def build(self, gallery: np.ndarray, row_seg: np.ndarray, seg_starts: np.ndarray, previous=None):
+        self.exact.build(gallery, row_seg, seg_starts)
+        m = gallery.shape[0]
+        self.use_exact = m == 0 or m < self.min_rows
+        if self.use_exact:
+            return self
+        nlist = self.nlist if self.nlist > 0 else int(4 * math.sqrt(m))
+        nlist = max(1, min(nlist, m))
+        cent = None
+        trained_rows = m
+        prev_cent = getattr(previous, 'centroids', None)
+        prev_rows = int(getattr(previous, 'trained_rows', 0) or 0)
+        if prev_cent is not None and prev_cent.shape[1] == gallery.shape[1] and prev_rows // 2 <= m <= prev_rows * 2:
+            # Small gallery changes keep the trained quantizer; only rows are re-bucketed
+            cent = prev_cent
+            trained_rows = prev_rows
+            nlist = cent.shape[0]
+        if cent is None:
+            cent = self._train(gallery, nlist)
+        assign = np.argmax(gallery @ cent.T, axis=1)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        self.gallery = gallery
+        self.row_seg = row_seg
+        self.n_seg = int(seg_starts.shape[0])
+        self.centroids = cent
+        self.trained_rows = trained_rows
+        self.list_rows = order.astype('int64')
+        self.list_starts = np.concatenate([[0], np.cumsum(counts)]).astype('int64')
+        return self
+
+    def employee_scores(self, Q: np.ndarray) -> np.ndarray:
+        if self.use_exact:
+            return self.exact.employee_scores(Q)
+        n = Q.shape[0]
+        nlist = self.centroids.shape[0]
+        nprobe = min(self.nprobe, nlist)
+        coarse = Q @ self.centroids.T  # (N, nlist)
+        if nprobe < nlist:
+            probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.tile(np.arange(nlist), (n, 1))
+        scores = np.full((n, self.n_seg), -1.0, dtype='float32')
+        for i in range(n):
+            rows = np.concatenate([self.list_rows[self.list_starts[c]:self.list_starts[c + 1]] for c in probes[i]])
+            if rows.size == 0:
+                continue
+            sims = self.gallery[rows] @ Q[i]
+            np.maximum.at(scores[i], self.row_seg[rows], sims)
+        return scores
+
+
+def make_index(cfg: Optional[dict] = None):
+    """Create the gallery index selected by `embedding_index` in parameter_config.json."""
+    cfg = cfg or {}
+    kind = str(cfg.get('embedding_index', 'exact') or 'exact').strip().lower()
+    if kind == 'ivf':
+        return IVFIndex(
+            nlist=int(cfg.get('embedding_index_nlist', 0)),
+            nprobe=int(cfg.get('embedding_index_nprobe', 8)),
+            min_rows=int(cfg.get('embedding_index_min_rows', 5000)),
+        )
+    if kind != 'exact':
+        print(f"[AI] Unknown embedding_index '{kind}', using exact search")
+    return ExactIndex()
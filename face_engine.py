@@ -0,0 +1,210 @@
+"""Shared InsightFace engine.
+
+One FaceAnalysis instance serves live tracking, face enrollment and snapshot
+annotation. Callers on any thread submit frames to a request queue that a
+single worker thread drains, so the ONNX sessions are never run concurrently.
+Requests that arrive together (e.g. the latest frames of several cameras) are
+grouped into one batch: detection runs per frame, ArcFace recognition runs
+once over the aligned crops of every face in the batch.
+
+Besides full detect+recognize requests, callers can ask for detection only
+and later embed just the faces that still need an identity.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class FaceEngine:
+    def __init__(self, det_size: Tuple[int, int], providers: List[str], request_timeout: float = 30.0,
+                 max_batch: int = 8, max_wait_ms: float = 5.0):
+        self.det_size = det_size
+        self.providers = providers
+        self.app = None
+        self.request_timeout = float(request_timeout)
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.rec_max_batch = 64
+        # (kind, frame, faces, input_size, future); kind is 'full', 'detect' or 'embed'
+        self._requests: "queue.Queue[Tuple[str, np.ndarray, Optional[list], Optional[Tuple[int, int]], Future]]" = queue.Queue()
+        self._init_engine()
+        self._worker = threading.Thread(target=self._serve_loop, name='FaceEngine', daemon=True)
+        self._worker.start()
+
+    def _init_engine(self):
+        try:
+            # Encourage TensorRT engine caching and FP16 when available
+            os.environ.setdefault('ORT_TENSORRT_ENGINE_CACHE_ENABLE', '1')
+            os.environ.setdefault('ORT_TENSORRT_FP16_ENABLE', '1')
+
+            from insightface.app import FaceAnalysis
+            # Log available ORT providers (if ORT installed)
+            try:
+                import onnxruntime as ort
+                print(f"[AI] ORT available providers: {getattr(ort, 'get_available_providers', lambda: [])()}")
+            except Exception as e:
+                print(f"[AI] ORT introspection not available: {e}")
+
+            attempted = []
+            # Build provider preference tiers
+            tiers = []
+            # Use configured providers as first tier if provided
+            if self.providers:
+                tiers.append(self.providers)
+            # Then try TensorRT+CUDA
+            tiers.append(['TensorrtExecutionProvider', 'CUDAExecutionProvider'])
+            # Then CUDA only
+            tiers.append(['CUDAExecutionProvider'])
+            # Finally CPU
+            tiers.append(['CPUExecutionProvider'])
+
+            last_err = None
+            for prov in tiers:
+                try:
+                    attempted.append(prov)
+                    
+                    # Tentukan ctx_id=0 (GPU) hanya jika provider GPU/TensorRT ada.
+                    # Jika hanya CPU, gunakan ctx_id=-1.
+                    ctx = 0 if any('CUDA' in p or 'Tensorrt' in p for p in prov) else -1
+
+                    from insightface.app import FaceAnalysis
+                    self.app = FaceAnalysis(name='buffalo_l', providers=prov)
+                    self.app.prepare(ctx_id=ctx, det_size=self.det_size)
+                    self.providers = prov  # record the actual providers used
+                    break
+                except Exception as e:
+                    last_err = e
+                    self.app = None
+                    # Hentikan looping jika sudah mencoba CPU, karena tidak ada fallback lain
+                    if 'CPUExecutionProvider' in prov:
+                        break
+                    continue
+
+            if self.app is None:
+                from insightface.app import FaceAnalysis
+                self.app = FaceAnalysis(name='buffalo_l')
+                # Gunakan ctx_id=-1 untuk memastikan CPU
+                self.app.prepare(ctx_id=-1, det_size=self.det_size)
+                self.providers = ['CPUExecutionProvider']
+            # warmup to initialize kernels if any
+            try:
+                import numpy as _np
+                _ = self.app.get((_np.zeros((self.det_size[1], self.det_size[0], 3), dtype='uint8')))
+            except Exception:
+                pass
+            try:
+                print(f"[AI] FaceAnalysis ready. Selected Providers={self.providers}, det_size={self.det_size}. Attempts={attempted}")
+                if last_err:
+                    print(f"[AI] Last provider init error (non-fatal): {last_err}")
+            except Exception:
+                pass
+        except Exception as e:
+            print(f"[AI] Failed to init FaceAnalysis: {e}")
+            self.app = None
+
+    def _next_batch(self) -> List[Tuple[str, np.ndarray, Optional[list], Optional[Tuple[int, int]], Future]]:
+        """Block for one request, then gather more for up to `max_wait` seconds."""
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._requests.get_nowait())
+                else:
+                    batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _serve_loop(self):
+        """Run queued requests in batches on the shared model."""
+        while True:
+            batch = [req for req in self._next_batch() if req[-1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self._run_batch([req[:-1] for req in batch])
+            except Exception as e:
+                for req in batch:
+                    req[-1].set_exception(e)
+                continue
+            for req, faces in zip(batch, results):
+                req[-1].set_result(faces)
+
+    def _run_batch(self, requests: List[Tuple[str, np.ndarray, Optional[list], Optional[Tuple[int, int]]]]) -> List[list]:
+        """Detect faces where requested, then embed all pending faces with batched ArcFace calls."""
+        det = getattr(self.app, 'det_model', None)
+        rec = getattr(self.app, 'models', {}).get('recognition')
+        if det is None or rec is None:
+            # Models not reachable individually: fall back to the full pipeline per frame
+            return [faces if kind == 'embed' else self.app.get(frame) for kind, frame, faces, _ in requests]
+        from insightface.app.common import Face
+        from insightface.utils import face_align
+        results: List[list] = []
+        crops: List[np.ndarray] = []
+        owners: list = []
+        for kind, frame, faces, input_size in requests:
+            if kind != 'embed':
+                # The bundled SCRFD detector has a fixed batch dimension of 1
+                bboxes, kpss = det.detect(frame, input_size=input_size, max_num=0, metric='default')
+                faces = []
+                for i in range(bboxes.shape[0]):
+                    kps = kpss[i] if kpss is not None else None
+                    faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+            if kind != 'detect':
+                for face in faces:
+                    kps = getattr(face, 'kps', None)
+                    if kps is not None:
+                        crops.append(face_align.norm_crop(frame, landmark=kps, image_size=rec.input_size[0]))
+                        owners.append(face)
+            results.append(faces)
+        for start in range(0, len(crops), self.rec_max_batch):
+            feats = rec.get_feat(crops[start:start + self.rec_max_batch])
+            for face, feat in zip(owners[start:start + self.rec_max_batch], feats):
+                face.embedding = feat.flatten()
+        return results
+
+    def _submit(self, kind: str, frame: np.ndarray, faces: Optional[list] = None,
+                input_size: Optional[Tuple[int, int]] = None) -> list:
+        fut: Future = Future()
+        self._requests.put((kind, frame, faces, input_size, fut))
+        return fut.result(timeout=self.request_timeout)
+
+    def get_faces(self, frame: np.ndarray):
+        """Detect and embed faces; safe to call from any thread (requests are serialized)."""
+        if self.app is None or frame is None:
+            return []
+        return self._submit('full', frame)
+
+    def detect_faces(self, frame: np.ndarray, input_size: Optional[Tuple[int, int]] = None):
+        """Detection only: faces carry bbox, kps and det_score but no embedding yet.
+
+        `input_size` (w, h) overrides the global detection size for this frame.
+        """
+        if self.app is None or frame is None:
+            return []
+        return self._submit('detect', frame, input_size=tuple(input_size) if input_size else None)
+
+    def embed_faces(self, frame: np.ndarray, faces: list):
+        """Compute embeddings in place for faces previously returned by detect_faces()."""
+        if self.app is None or frame is None or not faces:
+            return faces
+        return self._submit('embed', frame, list(faces))
+
+    def pending_requests(self) -> int:
+        return self._requests.qsize()
+
+    @staticmethod
+    def get_embedding(face) -> Optional[np.ndarray]:
+        emb = getattr(face, 'normed_embedding', None)
+        if emb is None:
+            emb = getattr(face, 'embedding', None)
+        if emb is None:
+            return None
+        return emb.astype('float32')
@@ -0,0 +1,423 @@
+"""Per-camera frame buffers shared by capture, inference and streaming.
+
+`FrameRing` keeps a small set of preallocated frame slots. The capture thread
+copies each new frame into a slot that nobody is reading and publishes it with
+a sequence number; readers get a read-only view of that slot, so they never
+copy and can compare sequence numbers to skip frames they already handled.
+`wait_newer()` blocks on a condition variable until a frame newer than the
+caller's last sequence number arrives, so consumers do not sleep-poll.
+
+A slot is only rewritten when no view of it is alive: every view keeps a
+reference to its slot array, which `sys.getrefcount` can see. If all slots are
+still referenced the writer allocates a replacement array instead of waiting.
+
+`SharedFrameStore` keeps the same rings in `multiprocessing.shared_memory`
+(one segment per camera) so other processes can read frames without pickling:
+`SharedFrameReader` copies the newest frame out of a segment by name, and
+`shared_frame_location()` lets a sender pass a frame as (segment, offset).
+Each segment starts with an int64 header guarded per slot like a seqlock:
+
+    [latest_seq, latest_slot, slots, slot_bytes,
+     then per slot: seq (-1 while being written), ts_us, h, w, c]
+
+Frames in shared segments are uint8 (BGR or gray). Within the writer's process
+the refcount protection above still applies; other processes validate the slot
+sequence after copying, so they never return a torn frame.
+
+`EncodedFrameCache` holds the newest encoded (JPEG) bytes per output variant
+of one camera, keyed by frame sequence, so a frame is encoded once no matter
+how many viewers or snapshot calls ask for it.
+"""
+import os
+import sys
+import atexit
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_HEADER = 4
+_SLOT_FIELDS = 5
+# name -> (base address, size) of shared segments created by this process
+_SEGMENTS: Dict[str, Tuple[int, int]] = {}
+_SEGMENTS_LOCK = threading.Lock()
+# Unlinked segments waiting for the last array into them to go away, with their idle refcount.
+# numpy arrays over shm.buf hold the mmap without a buffer export, so SharedMemory.close() would
+# succeed under a live view and leave it dangling; the mmap refcount is what tells us it is unused.
+_RETIRED: List[Tuple[shared_memory.SharedMemory, int]] = []
+
+
+def _align(n: int, to: int = 64) -> int:
+    return (int(n) + to - 1) // to * to
+
+
+def _buffer_address(buf) -> int:
+    probe = np.frombuffer(buf, dtype=np.uint8, count=1)
+    addr = int(probe.__array_interface__['data'][0])
+    del probe
+    return addr
+
+
+def _mmap_refs(shm: shared_memory.SharedMemory) -> int:
+    return sys.getrefcount(shm._mmap)
+
+
+def _release_retired() -> None:
+    with _SEGMENTS_LOCK:
+        keep = []
+        for shm, idle_refs in _RETIRED:
+            if _mmap_refs(shm) > idle_refs:
+                keep.append((shm, idle_refs))
+                continue
+            try:
+                shm.close()
+            except Exception:
+                pass
+        _RETIRED[:] = keep
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to a segment owned by another process without letting our resource tracker unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name != 'nt':
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+        return shm
+
+
+def shared_frame_location(arr: np.ndarray) -> Optional[Tuple[str, int]]:
+    """(segment name, byte offset) if `arr` is a contiguous frame inside a shared segment of this process."""
+    if arr is None or not arr.flags.c_contiguous:
+        return None
+    addr = int(arr.__array_interface__['data'][0])
+    with _SEGMENTS_LOCK:
+        for name, (base, size) in _SEGMENTS.items():
+            if base <= addr and addr + arr.nbytes <= base + size:
+                return name, addr - base
+    return None
+
+
+class FrameRing:
+    def __init__(self, slots: int = 4):
+        self.slots = max(2, int(slots))
+        self._bufs: List[Optional[np.ndarray]] = [None] * self.slots
+        self._owned: List[bool] = [False] * self.slots
+        # Reference count of an unused slot as seen by _refs(); more means someone is reading it
+        self._bufs[0] = np.empty((1,), dtype='uint8')
+        self._free_refs = self._refs(0)
+        self._bufs[0] = None
+        self._next = 0
+        self._seq = 0
+        # (seq, ts, slot array); replaced as a whole so readers need no lock
+        self._latest: Optional[Tuple[int, float, np.ndarray]] = None
+        self._write_lock = threading.Lock()
+        self._new_frame = threading.Condition(self._write_lock)
+        self.reallocations = 0
+
+    @property
+    def seq(self) -> int:
+        entry = self._latest
+        return entry[0] if entry is not None else 0
+
+    def _refs(self, i: int) -> int:
+        buf = self._bufs[i]
+        return sys.getrefcount(buf)
+
+    def _alloc(self, i: int, shape, dtype) -> np.ndarray:
+        """Storage for slot i; subclasses place it elsewhere (e.g. shared memory)."""
+        return np.empty(shape, dtype=dtype)
+
+    def _begin_write(self, i: int) -> None:
+        pass
+
+    def _published(self, i: int, seq: int, ts: float, buf: np.ndarray) -> None:
+        pass
+
+    def _free_slot(self, shape, dtype) -> int:
+        for k in range(self.slots):
+            i = (self._next + k) % self.slots
+            if self._bufs[i] is not None and self._refs(i) > self._free_refs:
+                continue
+            buf = self._bufs[i]
+            if buf is None or buf.shape != shape or buf.dtype != dtype or not self._owned[i]:
+                del buf
+                self._bufs[i] = self._alloc(i, shape, dtype)
+                self._owned[i] = True
+            return i
+        # Every slot is held by a reader or is the latest frame: give the next one a private array;
+        # whoever holds the old array keeps it alive
+        i = self._next
+        self._bufs[i] = np.empty(shape, dtype=dtype)
+        self._owned[i] = False
+        self.reallocations += 1
+        return i
+
+    def write(self, frame: np.ndarray, ts: Optional[float] = None) -> int:
+        """Copy `frame` into a free slot and publish it; returns its sequence number."""
+        with self._write_lock:
+            i = self._free_slot(frame.shape, frame.dtype)
+            buf = self._bufs[i]
+            owned = self._owned[i]
+            if owned:
+                self._begin_write(i)
+            np.copyto(buf, frame)
+            self._next = (i + 1) % self.slots
+            self._seq += 1
+            ts = time.time() if ts is None else ts
+            if owned:
+                self._published(i, self._seq, ts, buf)
+            self._latest = (self._seq, ts, buf)
+            self._new_frame.notify_all()
+            return self._seq
+
+    def latest(self) -> Tuple[int, float, Optional[np.ndarray]]:
+        """(seq, ts, read-only view) of the newest frame; (0, 0.0, None) before the first write."""
+        entry = self._latest
+        if entry is None:
+            return 0, 0.0, None
+        seq, ts, buf = entry
+        view = buf.view()
+        view.flags.writeable = False
+        return seq, ts, view
+
+    def wait_newer(self, after_seq: int, timeout: Optional[float] = None) -> Tuple[int, float, Optional[np.ndarray]]:
+        """Block until a frame with seq > after_seq is published; returns latest() or (0, 0.0, None) on timeout.
+
+        A ring whose seq is below after_seq was recreated (camera restarted) after the caller's last
+        frame, so its newest frame is returned right away instead of waiting for seq to catch up.
+        """
+        with self._new_frame:
+            if not self._new_frame.wait_for(lambda: self._latest is not None and self._latest[0] != after_seq, timeout):
+                return 0, 0.0, None
+        return self.latest()
+
+    def clear(self) -> None:
+        with self._write_lock:
+            self._latest = None
+            self._bufs = [None] * self.slots
+            self._owned = [False] * self.slots
+
+
+class SharedFrameRing(FrameRing):
+    """FrameRing whose slots live in one shared-memory segment."""
+
+    def __init__(self, name: str, slots: int = 6):
+        super().__init__(slots)
+        self.name_prefix = name
+        self._gen = 0
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._header: Optional[np.ndarray] = None
+        self._data_off = 0
+        self._slot_bytes = 0
+        self._idle_refs = 0
+
+    @property
+    def segment_name(self) -> Optional[str]:
+        return self._shm.name if self._shm is not None else None
+
+    def _ensure_segment(self, nbytes: int) -> None:
+        if self._shm is not None and nbytes <= self._slot_bytes:
+            return
+        self._retire()
+        self._gen += 1
+        slot_bytes = _align(nbytes)
+        header_len = _HEADER + self.slots * _SLOT_FIELDS
+        data_off = _align(header_len * 8)
+        shm = shared_memory.SharedMemory(create=True, size=data_off + self.slots * slot_bytes,
+                                         name=f'{self.name_prefix}_{self._gen}')
+        self._idle_refs = _mmap_refs(shm)
+        header = np.ndarray((header_len,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[2] = self.slots
+        header[3] = slot_bytes
+        self._shm, self._header, self._data_off, self._slot_bytes = shm, header, data_off, slot_bytes
+        with _SEGMENTS_LOCK:
+            _SEGMENTS[shm.name] = (_buffer_address(shm.buf), shm.size)
+        # Slots still pointing into the old segment are re-placed on their next write
+        self._owned = [False] * self.slots
+
+    def _alloc(self, i: int, shape, dtype) -> np.ndarray:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if np.dtype(dtype) != np.uint8 or len(shape) not in (2, 3):
+            return np.empty(shape, dtype=dtype)
+        self._ensure_segment(nbytes)
+        return np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=self._data_off + i * self._slot_bytes)
+
+    def _begin_write(self, i: int) -> None:
+        if self._header is not None:
+            self._header[_HEADER + i * _SLOT_FIELDS] = -1
+
+    def _published(self, i: int, seq: int, ts: float, buf: np.ndarray) -> None:
+        if _RETIRED:
+            _release_retired()
+        h = self._header
+        if h is None or shared_frame_location(buf) is None:
+            return
+        b = _HEADER + i * _SLOT_FIELDS
+        h[b + 1] = int(ts * 1e6)
+        h[b + 2] = buf.shape[0]
+        h[b + 3] = buf.shape[1]
+        h[b + 4] = buf.shape[2] if buf.ndim == 3 else 1
+        h[b] = seq
+        h[1] = i
+        h[0] = seq
+
+    def _retire(self) -> None:
+        if self._shm is None:
+            return
+        if self._header is not None:
+            self._header[0] = -1  # tells readers the camera moved to a new segment
+        with _SEGMENTS_LOCK:
+            _SEGMENTS.pop(self._shm.name, None)
+        try:
+            self._shm.unlink()
+        except Exception:
+            pass
+        with _SEGMENTS_LOCK:
+            _RETIRED.append((self._shm, self._idle_refs))
+        self._shm, self._header = None, None
+        _release_retired()
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._latest = None
+            self._bufs = [None] * self.slots
+            self._owned = [False] * self.slots
+            self._retire()
+
+
+class SharedFrameStore:
+    """Shared-memory frame rings keyed by camera id."""
+
+    def __init__(self, slots: int = 6, prefix: Optional[str] = None):
+        self.slots = max(2, int(slots))
+        self.prefix = prefix or f'frm{os.getpid()}'
+        self._rings: Dict[int, SharedFrameRing] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def ring(self, cam_id: int) -> SharedFrameRing:
+        with self._lock:
+            ring = self._rings.get(cam_id)
+            if ring is None:
+                ring = self._rings[cam_id] = SharedFrameRing(f'{self.prefix}_c{int(cam_id)}', self.slots)
+            return ring
+
+    def drop(self, cam_id: int) -> None:
+        with self._lock:
+            ring = self._rings.pop(cam_id, None)
+        if ring is not None:
+            ring.close()
+
+    def segment_names(self) -> Dict[int, Optional[str]]:
+        with self._lock:
+            return {cid: ring.segment_name for cid, ring in self._rings.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            rings = list(self._rings.values())
+            self._rings.clear()
+        for ring in rings:
+            ring.close()
+
+
+class SharedFrameReader:
+    """Reads the newest frame of a SharedFrameRing segment from any process."""
+
+    def __init__(self, name: str):
+        self.shm = attach_shared_memory(name)
+        head = np.ndarray((_HEADER,), dtype=np.int64, buffer=self.shm.buf)
+        self.slots = int(head[2])
+        self.slot_bytes = int(head[3])
+        del head
+        self._header = np.ndarray((_HEADER + self.slots * _SLOT_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        self._data_off = _align((_HEADER + self.slots * _SLOT_FIELDS) * 8)
+
+    @property
+    def moved(self) -> bool:
+        return int(self._header[0]) < 0
+
+    def latest(self, after_seq: int = 0, retries: int = 3) -> Tuple[int, float, Optional[np.ndarray]]:
+        """(seq, ts, private copy) of the newest frame newer than after_seq, else (0, 0.0, None)."""
+        h = self._header
+        for _ in range(retries):
+            if int(h[0]) <= after_seq:
+                return 0, 0.0, None
+            i = int(h[1])
+            b = _HEADER + i * _SLOT_FIELDS
+            seq = int(h[b])
+            if seq <= 0:
+                continue
+            ts = int(h[b + 1]) / 1e6
+            rows, cols, ch = int(h[b + 2]), int(h[b + 3]), int(h[b + 4])
+            shape = (rows, cols, ch) if ch > 1 else (rows, cols)
+            view = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=self._data_off + i * self.slot_bytes)
+            out = view.copy()
+            del view
+            if int(h[b]) == seq:
+                return seq, ts, out
+        return 0, 0.0, None
+
+    def close(self) -> None:
+        self._header = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+
+
+class EncodedFrameCache:
+    """Newest encoded bytes per variant key (e.g. (width, quality, annotated)) of one camera.
+
+    `get()` encodes at most once per (key, seq): concurrent callers for the same key
+    wait for the encode in progress and share its result; different keys encode in
+    parallel. Variants nobody asked for within `idle_sec` are dropped.
+    """
+
+    def __init__(self, idle_sec: float = 30.0):
+        self.idle_sec = float(idle_sec)
+        # key -> [lock, seq, ts, data, last_used]
+        self._entries: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self.encodes = 0
+        self.hits = 0
+
+    def _entry(self, key: tuple) -> list:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [threading.Lock(), 0, 0.0, None, now]
+                for k in [k for k, e in self._entries.items() if now - e[4] > self.idle_sec]:
+                    del self._entries[k]
+            entry[4] = now
+            return entry
+
+    def get(self, key: tuple, seq: int, ts: float, produce) -> Tuple[int, float, Optional[bytes]]:
+        """(seq, ts, bytes) for `key` at frame `seq` or newer; calls produce() only on a miss.
+
+        "Newer" needs both a higher seq and a later ts: a ring recreated by a camera restart numbers
+        from 1 again, so a cached frame from the old ring (high seq, old ts) must not shadow it.
+        """
+        entry = self._entry(key)
+        with entry[0]:
+            if entry[3] is not None and entry[1] >= seq and entry[2] >= ts:
+                self.hits += 1
+                return entry[1], entry[2], entry[3]
+            data = produce()
+            if data is None:
+                return 0, 0.0, None
+            self.encodes += 1
+            entry[1], entry[2], entry[3] = seq, ts, data
+            return seq, ts, data
+
+    def stats(self) -> Dict[str, int]:
+        return {'encodes': self.encodes, 'hits': self.hits, 'variants': len(self._entries)}
@@ -0,0 +1,448 @@
+"""Optional multi-process face inference.
+
+`InferencePool` has the same calling surface as `face_engine.FaceEngine`
+(get_faces / detect_faces / embed_faces / get_embedding), but runs the
+InsightFace models in separate worker processes so detection and recognition
+(including their Python pre/post-processing) do not contend on the GIL of the
+Flask/tracking process. Matching, tracking and all state stay in the main
+process.
+
+Frames are not pickled: the main process copies each frame into a
+`multiprocessing.shared_memory` slot and sends only the slot name, offset,
+shape and request over a `multiprocessing.connection` socket; workers answer
+with the small per-face arrays (bbox, kps, score, embedding). Frames that
+already live in a `frame_store.SharedFrameStore` segment are sent by location
+without the copy.
+
+Workers are started as `python inference_pool.py --worker ...` rather than
+through multiprocessing spawn, so they never re-import app.py/module_AI.py
+(which would start cameras and load a second tracker). Only face_engine is
+imported on the worker side. A worker that dies is restarted; its in-flight
+requests fail and callers see an exception just like an engine error. A
+worker only takes requests once its models are loaded; one that keeps failing
+to start is retried with backoff and given up after MAX_START_FAILURES, and
+when every worker is given up the pool reports itself unavailable
+(`on_unavailable`) so the caller can fall back to an in-process engine.
+"""
+import os
+import sys
+import time
+import atexit
+import threading
+import subprocess
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from face_engine import FaceEngine
+from frame_store import attach_shared_memory, shared_frame_location
+
+_AUTHKEY_ENV = 'FACE_POOL_AUTHKEY'
+# Consecutive failed starts (exit before the models loaded) before a worker is given up
+MAX_START_FAILURES = 5
+RESPAWN_BACKOFF_MAX_SEC = 30.0
+
+
+class RemoteFace:
+    """Face result returned by a worker process (mirrors the insightface Face attributes used here)."""
+    __slots__ = ('bbox', 'kps', 'det_score', 'embedding')
+
+    def __init__(self, bbox, kps=None, det_score=0.0, embedding=None):
+        self.bbox = bbox
+        self.kps = kps
+        self.det_score = det_score
+        self.embedding = embedding
+
+    @property
+    def normed_embedding(self):
+        if self.embedding is None:
+            return None
+        return self.embedding / (np.linalg.norm(self.embedding) + 1e-8)
+
+
+def _face_to_tuple(face) -> tuple:
+    def arr(v):
+        return None if v is None else np.asarray(v, dtype='float32')
+    return (arr(getattr(face, 'bbox', None)), arr(getattr(face, 'kps', None)),
+            float(getattr(face, 'det_score', 0.0) or 0.0), arr(getattr(face, 'embedding', None)))
+
+
+class _ShmSlots:
+    """Recycled shared-memory buffers for frames in flight to workers."""
+
+    def __init__(self, max_slots: int):
+        self.max_slots = max(1, int(max_slots))
+        self._free: List[shared_memory.SharedMemory] = []
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, timeout: float) -> shared_memory.SharedMemory:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for i, shm in enumerate(self._free):
+                    if shm.size >= nbytes:
+                        return self._free.pop(i)
+                if self._count < self.max_slots:
+                    self._count += 1
+                    break
+                if self._free:
+                    # Too small for this frame: replace it with a bigger one
+                    old = self._free.pop(0)
+                    self._destroy(old)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise TimeoutError('no free shared-memory frame slot')
+        return shared_memory.SharedMemory(create=True, size=int(nbytes))
+
+    def release(self, shm: shared_memory.SharedMemory) -> None:
+        with self._cond:
+            self._free.append(shm)
+            self._cond.notify()
+
+    @staticmethod
+    def _destroy(shm: shared_memory.SharedMemory) -> None:
+        try:
+            shm.close()
+            shm.unlink()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        with self._cond:
+            for shm in self._free:
+                self._destroy(shm)
+            self._free.clear()
+
+
+class _Worker:
+    def __init__(self, idx: int, proc: Optional[subprocess.Popen]):
+        self.idx = idx
+        self.proc = proc
+        self.conn = None
+        self.ready = False  # models loaded, accepting requests
+        self.send_lock = threading.Lock()
+        # req_id -> (future, pool slot or None for frames sent in place, faces to fill)
+        self.inflight: Dict[int, Tuple[Future, Optional[shared_memory.SharedMemory], Optional[list]]] = {}
+
+
+class InferencePool:
+    def __init__(self, workers: int, det_size: Tuple[int, int], providers: List[str], request_timeout: float = 30.0,
+                 max_batch: int = 8, max_wait_ms: float = 5.0, start_timeout: float = 120.0,
+                 on_unavailable: Optional[Callable[[], None]] = None):
+        self.det_size = tuple(det_size)
+        self.providers = providers
+        self.request_timeout = float(request_timeout)
+        self.max_batch = int(max_batch)
+        self.max_wait_ms = float(max_wait_ms)
+        self.n_workers = max(1, int(workers))
+        self._authkey = os.urandom(16)
+        self._listener = Listener(('127.0.0.1', 0), authkey=self._authkey)
+        self._workers: Dict[int, _Worker] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._slots = _ShmSlots(self.n_workers * 4)
+        self._next_id = 0
+        self._closed = False
+        self._start_failures: Dict[int, int] = {idx: 0 for idx in range(self.n_workers)}
+        self._given_up: set = set()
+        self.on_unavailable = on_unavailable
+        threading.Thread(target=self._accept_loop, name='InferencePool-accept', daemon=True).start()
+        for idx in range(self.n_workers):
+            self._spawn(idx)
+        # Wait for a worker with loaded models, or until every worker failed its first start
+        with self._ready:
+            self._ready.wait_for(lambda: any(w.ready for w in self._workers.values())
+                                 or all(self._start_failures.values()), start_timeout)
+        ready = sum(1 for w in self._workers.values() if w.ready)
+        print(f"[AI] Inference pool: {ready}/{self.n_workers} worker processes ready")
+        atexit.register(self.close)
+
+    # FaceEngine compatibility: app.py treats a non-None `app` as "engine available"
+    @property
+    def app(self):
+        with self._lock:
+            return self if any(w.ready and w.conn is not None for w in self._workers.values()) else None
+
+    @property
+    def available(self) -> bool:
+        """False once every worker was given up after repeated failed starts."""
+        with self._lock:
+            return not self._closed and len(self._given_up) < self.n_workers
+
+    @staticmethod
+    def get_embedding(face) -> Optional[np.ndarray]:
+        return FaceEngine.get_embedding(face)
+
+    def _spawn(self, idx: int) -> None:
+        host, port = self._listener.address
+        env = dict(os.environ)
+        env[_AUTHKEY_ENV] = self._authkey.hex()
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', str(idx), f'{host}:{port}',
+               '--det-size', f'{self.det_size[0]},{self.det_size[1]}', '--providers', ','.join(self.providers),
+               '--max-batch', str(self.max_batch), '--max-wait-ms', str(self.max_wait_ms)]
+        # Register before starting so a fast worker cannot connect to an unknown slot
+        w = _Worker(idx, None)
+        with self._lock:
+            self._workers[idx] = w
+        w.proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        # Watch the process rather than the connection: a worker can die before it connects
+        threading.Thread(target=self._watch_worker, args=(w,), name=f'InferencePool-watch-{idx}', daemon=True).start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+                idx = int(conn.recv())
+            except Exception:
+                if self._closed:
+                    return
+                continue
+            with self._ready:
+                w = self._workers.get(idx)
+                if w is None:
+                    conn.close()
+                    continue
+                w.conn = conn
+                self._ready.notify_all()
+            threading.Thread(target=self._reader_loop, args=(w,), name=f'InferencePool-{idx}', daemon=True).start()
+
+    def _reader_loop(self, w: _Worker):
+        while True:
+            try:
+                msg = w.conn.recv()
+            except (EOFError, OSError):
+                break
+            if msg == 'ready':
+                with self._ready:
+                    w.ready = True
+                    self._start_failures[w.idx] = 0
+                    self._ready.notify_all()
+                continue
+            req_id, faces, err = msg
+            with self._lock:
+                entry = w.inflight.pop(req_id, None)
+            if entry is None:
+                continue
+            fut, shm, targets = entry
+            if shm is not None:
+                self._slots.release(shm)
+            if err is not None:
+                fut.set_exception(RuntimeError(err))
+                continue
+            if targets is not None:
+                for face, (_b, _k, _s, emb) in zip(targets, faces):
+                    face.embedding = emb
+                fut.set_result(targets)
+            else:
+                fut.set_result([RemoteFace(b, k, s, e) for b, k, s, e in faces])
+        self._fail_inflight(w)
+
+    def _fail_inflight(self, w: _Worker):
+        with self._lock:
+            w.conn = None
+            pending = list(w.inflight.values())
+            w.inflight.clear()
+        for fut, shm, _ in pending:
+            if shm is not None:
+                self._slots.release(shm)
+            if not fut.done():
+                fut.set_exception(RuntimeError('inference worker exited'))
+
+    def _watch_worker(self, w: _Worker):
+        code = w.proc.wait()
+        self._fail_inflight(w)
+        if self._closed:
+            return
+        with self._ready:
+            if w.ready:
+                self._start_failures[w.idx] = 0
+            else:
+                self._start_failures[w.idx] += 1
+            failures = self._start_failures[w.idx]
+            w.ready = False
+            if failures >= MAX_START_FAILURES:
+                self._given_up.add(w.idx)
+            all_given_up = len(self._given_up) >= self.n_workers
+            self._ready.notify_all()
+        if failures >= MAX_START_FAILURES:
+            print(f"[AI] Inference worker {w.idx} failed to start {failures} times (code={code}), giving up")
+            if all_given_up and self.on_unavailable is not None:
+                try:
+                    self.on_unavailable()
+                except Exception as e:
+                    print(f"[AI] Inference pool fallback failed: {e}")
+            return
+        # Immediate-ish restart after a crash, exponential backoff while it keeps failing to start
+        delay = min(RESPAWN_BACKOFF_MAX_SEC, 2.0 ** max(0, failures - 1))
+        print(f"[AI] Inference worker {w.idx} exited (code={code}), restarting in {delay:g}s")
+        time.sleep(delay)
+        if not self._closed:
+            self._spawn(w.idx)
+
+    def _submit(self, kind: str, frame: np.ndarray, faces: Optional[list] = None,
+                input_size: Optional[Tuple[int, int]] = None) -> list:
+        frame = np.ascontiguousarray(frame)
+        # A frame already in a shared frame ring stays put for the whole call: the caller's
+        # view keeps the ring from rewriting that slot until we return
+        loc = shared_frame_location(frame)
+        if loc is not None:
+            shm = None
+            shm_name, offset = loc
+        else:
+            shm = self._slots.acquire(frame.nbytes, self.request_timeout)
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)[...] = frame
+            shm_name, offset = shm.name, 0
+        fut: Future = Future()
+        payload = [_face_to_tuple(f)[:3] for f in faces] if faces is not None else None
+        with self._lock:
+            live = [w for w in self._workers.values() if w.ready and w.conn is not None]
+            if not live:
+                if shm is not None:
+                    self._slots.release(shm)
+                raise RuntimeError('no inference worker available')
+            w = min(live, key=lambda x: len(x.inflight))
+            self._next_id += 1
+            req_id = self._next_id
+            w.inflight[req_id] = (fut, shm, faces)
+        try:
+            with w.send_lock:
+                w.conn.send((req_id, kind, shm_name, offset, frame.shape, frame.dtype.str, input_size, payload))
+        except Exception as e:
+            with self._lock:
+                if w.inflight.pop(req_id, None) is not None and shm is not None:
+                    self._slots.release(shm)
+            raise RuntimeError(f'inference worker send failed: {e}')
+        return fut.result(timeout=self.request_timeout)
+
+    def get_faces(self, frame: np.ndarray):
+        if frame is None:
+            return []
+        return self._submit('full', frame)
+
+    def detect_faces(self, frame: np.ndarray, input_size: Optional[Tuple[int, int]] = None):
+        if frame is None:
+            return []
+        return self._submit('detect', frame, input_size=tuple(input_size) if input_size else None)
+
+    def embed_faces(self, frame: np.ndarray, faces: list):
+        if frame is None or not faces:
+            return faces
+        return self._submit('embed', frame, list(faces))
+
+    def pending_requests(self) -> int:
+        with self._lock:
+            return sum(len(w.inflight) for w in self._workers.values())
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers.values())
+        for w in workers:
+            try:
+                if w.conn is not None:
+                    w.conn.close()
+            except Exception:
+                pass
+            try:
+                w.proc.terminate()
+            except Exception:
+                pass
+        try:
+            self._listener.close()
+        except Exception:
+            pass
+        self._slots.close()
+
+
+def _worker_main(idx: int, address: str, det_size: Tuple[int, int], providers: List[str],
+                 max_batch: int, max_wait_ms: float) -> int:
+    from concurrent.futures import ThreadPoolExecutor
+    host, port = address.rsplit(':', 1)
+    conn = Client((host, int(port)), authkey=bytes.fromhex(os.environ[_AUTHKEY_ENV]))
+    conn.send(idx)
+    engine = FaceEngine(det_size, providers, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    if engine.app is None:
+        # Exit instead of serving errors; the pool counts this as a failed start
+        print(f"[AI] Inference worker {idx}: face models failed to load")
+        conn.close()
+        return 3
+    conn.send('ready')
+    attached: Dict[str, shared_memory.SharedMemory] = {}
+    busy: Dict[str, int] = {}  # requests still reading each attached segment
+    send_lock = threading.Lock()
+    attach_lock = threading.Lock()
+
+    def handle(req_id, kind, shm, offset, shape, dtype, input_size, faces):
+        try:
+            frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            if kind == 'detect':
+                out = engine.detect_faces(frame, input_size=input_size)
+            elif kind == 'embed':
+                out = engine.embed_faces(frame, [RemoteFace(b, k, s) for b, k, s in faces])
+            else:
+                out = engine.get_faces(frame)
+            del frame
+            reply = (req_id, [_face_to_tuple(f) for f in (out or [])], None)
+        except Exception as e:
+            reply = (req_id, None, str(e))
+        frame = None
+        with attach_lock:
+            busy[shm.name] -= 1
+        with send_lock:
+            conn.send(reply)
+
+    # Requests run concurrently so the engine can batch them like it does in-process
+    with ThreadPoolExecutor(max_workers=max(1, max_batch), thread_name_prefix='pool-req') as executor:
+        while True:
+            try:
+                req_id, kind, shm_name, offset, shape, dtype, input_size, faces = conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                with attach_lock:
+                    shm = attached.get(shm_name)
+                    if shm is None:
+                        if len(attached) >= 64:
+                            # Segments replaced by the main process are never reused; drop old handles
+                            # that no running request is reading (closing under a live view would crash)
+                            for name in [n for n in attached if not busy.get(n)][:32]:
+                                busy.pop(name, None)
+                                try:
+                                    attached.pop(name).close()
+                                except Exception:
+                                    pass
+                        shm = attached[shm_name] = attach_shared_memory(shm_name)
+                    busy[shm.name] = busy.get(shm.name, 0) + 1
+            except Exception as e:
+                with send_lock:
+                    conn.send((req_id, None, str(e)))
+                continue
+            executor.submit(handle, req_id, kind, shm, offset, shape, dtype, input_size, faces)
+    for shm in attached.values():
+        try:
+            shm.close()
+        except Exception:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    import argparse
+    ap = argparse.ArgumentParser(description='Face inference worker process (started by InferencePool).')
+    ap.add_argument('--worker', nargs=2, metavar=('IDX', 'HOST:PORT'), required=True)
+    ap.add_argument('--det-size', default='640,640')
+    ap.add_argument('--providers', default='CPUExecutionProvider')
+    ap.add_argument('--max-batch', type=int, default=8)
+    ap.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = ap.parse_args()
+    w, h = [int(v) for v in args.det_size.split(',')]
+    sys.exit(_worker_main(int(args.worker[0]), args.worker[1], (w, h),
+                          [p.strip() for p in args.providers.split(',') if p.strip()],
+                          args.max_batch, args.max_wait_ms))
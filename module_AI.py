@@ -28,6 +28,10 @@ from database_models import (
     AlertLog,
 )
 from sqlalchemy.orm import joinedload
+from embedding_index import ExactIndex, make_index
+from face_engine import FaceEngine
+from capture import open_capture
+from frame_store import EncodedFrameCache, FrameRing, SharedFrameStore
 
 # ---- Config loader ----
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35,6 +39,7 @@ CONFIG_DIR = os.path.join(BASE_DIR, 'config')
 PARAM_PATH = os.path.join(CONFIG_DIR, 'parameter_config.json')
 DB_DIR = os.path.join(BASE_DIR, 'db')
 TRACK_STATE_PATH = os.path.join(CONFIG_DIR, 'tracking_mode.json')
+CAMERA_DIR = os.path.join(BASE_DIR, 'camera_configs')
 
 # Cached tracking state for alert suppression
 _track_cache = {
@@ -91,155 +96,402 @@ def _load_config() -> dict:
         }
 
 
-# ---- Face engine wrapper ----
-class FaceEngine:
-    def __init__(self, det_size: Tuple[int, int], providers: List[str]):
-        self.det_size = det_size
-        self.providers = providers
-        self.app = None
-        self._init_engine()
-
-    def _init_engine(self):
-        try:
-            # Encourage TensorRT engine caching and FP16 when available
-            os.environ.setdefault('ORT_TENSORRT_ENGINE_CACHE_ENABLE', '1')
-            os.environ.setdefault('ORT_TENSORRT_FP16_ENABLE', '1')
+def _load_camera_config(cam_id: int) -> dict:
+    """Read camera_configs/CAM{id}/config.json (or the folder whose config has this id)."""
+    path = os.path.join(CAMERA_DIR, f'CAM{cam_id}', 'config.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f) or {}
+    except Exception:
+        pass
+    try:
+        for name in os.listdir(CAMERA_DIR):
+            cfg_path = os.path.join(CAMERA_DIR, name, 'config.json')
+            if not os.path.isfile(cfg_path):
+                continue
+            with open(cfg_path, 'r', encoding='utf-8') as f:
+                cfg = json.load(f) or {}
+            if int(cfg.get('id', -1)) == int(cam_id):
+                return cfg
+    except Exception:
+        pass
+    return {}
 
-            from insightface.app import FaceAnalysis
-            # Log available ORT providers (if ORT installed)
-            try:
-                import onnxruntime as ort
-                print(f"[AI] ORT available providers: {getattr(ort, 'get_available_providers', lambda: [])()}")
-            except Exception as e:
-                print(f"[AI] ORT introspection not available: {e}")
-
-            attempted = []
-            # Build provider preference tiers
-            tiers = []
-            # Use configured providers as first tier if provided
-            if self.providers:
-                tiers.append(self.providers)
-            # Then try TensorRT+CUDA
-            tiers.append(['TensorrtExecutionProvider', 'CUDAExecutionProvider'])
-            # Then CUDA only
-            tiers.append(['CUDAExecutionProvider'])
-            # Finally CPU
-            tiers.append(['CPUExecutionProvider'])
-
-            last_err = None
-            for prov in tiers:
-                try:
-                    attempted.append(prov)
-                    
-                    # Tentukan ctx_id=0 (GPU) hanya jika provider GPU/TensorRT ada.
-                    # Jika hanya CPU, gunakan ctx_id=-1.
-                    ctx = 0 if any('CUDA' in p or 'Tensorrt' in p for p in prov) else -1
-
-                    from insightface.app import FaceAnalysis
-                    self.app = FaceAnalysis(name='buffalo_l', providers=prov)
-                    self.app.prepare(ctx_id=ctx, det_size=self.det_size)
-                    self.providers = prov  # record the actual providers used
-                    break
-                except Exception as e:
-                    last_err = e
-                    self.app = None
-                    # Hentikan looping jika sudah mencoba CPU, karena tidak ada fallback lain
-                    if 'CPUExecutionProvider' in prov:
-                        break
-                    continue
 
-            if self.app is None:
-                from insightface.app import FaceAnalysis
-                self.app = FaceAnalysis(name='buffalo_l')
-                # Gunakan ctx_id=-1 untuk memastikan CPU
-                self.app.prepare(ctx_id=-1, det_size=self.det_size)
-                self.providers = ['CPUExecutionProvider']
-            # warmup to initialize kernels if any
-            try:
-                import numpy as _np
-                _ = self.app.get((_np.zeros((self.det_size[1], self.det_size[0], 3), dtype='uint8')))
-            except Exception:
-                pass
-            try:
-                print(f"[AI] FaceAnalysis ready. Selected Providers={self.providers}, det_size={self.det_size}. Attempts={attempted}")
-                if last_err:
-                    print(f"[AI] Last provider init error (non-fatal): {last_err}")
-            except Exception:
-                pass
-        except Exception as e:
-            print(f"[AI] Failed to init FaceAnalysis: {e}")
-            self.app = None
+# ---- Per-camera detection region ----
+class _CameraROI:
+    """Region of interest and detector input size for one camera.
 
-    def get_faces(self, frame: np.ndarray):
-        if self.app is None:
-            return []
-        return self.app.get(frame)
+    `roi` is a polygon of normalized [x, y] points (0..1) in the camera config.
+    Detection runs on the polygon's bounding rectangle, with pixels outside the
+    polygon blacked out. Without an explicit `detection_size`, the global size is
+    shrunk to the ROI aspect ratio so a doorway strip is not letterboxed into a
+    square input.
+    """
 
-    @staticmethod
-    def get_embedding(face) -> Optional[np.ndarray]:
-        emb = getattr(face, 'normed_embedding', None)
-        if emb is None:
-            emb = getattr(face, 'embedding', None)
-        if emb is None:
-            return None
-        return emb.astype('float32')
+    def __init__(self, roi, detection_size, default_size: Tuple[int, int]):
+        self.points: Optional[np.ndarray] = None
+        try:
+            pts = np.asarray(roi, dtype='float32').reshape(-1, 2) if roi else None
+            if pts is not None and pts.shape[0] >= 3:
+                self.points = np.clip(pts, 0.0, 1.0)
+        except Exception:
+            print(f"[AI] Ignoring invalid roi: {roi}")
+        self.detection_size: Optional[Tuple[int, int]] = None
+        try:
+            if detection_size:
+                ds = [int(v) for v in (detection_size if isinstance(detection_size, (list, tuple)) else [detection_size, detection_size])]
+                self.detection_size = (ds[0], ds[1])
+        except Exception:
+            print(f"[AI] Ignoring invalid detection_size: {detection_size}")
+        self.default_size = (int(default_size[0]), int(default_size[1]))
+        self._shape = None
+        self.rect: Optional[Tuple[int, int, int, int]] = None
+        self.mask: Optional[np.ndarray] = None
+        self.input_size: Optional[Tuple[int, int]] = self.detection_size
+
+    @property
+    def active(self) -> bool:
+        return self.points is not None or self.detection_size is not None
+
+    def _prepare(self, shape):
+        h, w = shape[:2]
+        self._shape = shape[:2]
+        self.rect = None
+        self.mask = None
+        self.input_size = self.detection_size
+        if self.points is None:
+            return
+        poly = np.round(self.points * np.array([w, h], dtype='float32')).astype('int32')
+        x0, y0 = max(0, int(poly[:, 0].min())), max(0, int(poly[:, 1].min()))
+        x1, y1 = min(w, int(poly[:, 0].max())), min(h, int(poly[:, 1].max()))
+        if x1 - x0 < 16 or y1 - y0 < 16:
+            print(f"[AI] ROI too small for frame {w}x{h}, using full frame")
+            return
+        self.rect = (x0, y0, x1, y1)
+        local = poly - np.array([x0, y0], dtype='int32')
+        mask = np.zeros((y1 - y0, x1 - x0), dtype='uint8')
+        cv2.fillPoly(mask, [local], 255)
+        # Axis-aligned rectangles need no masking
+        self.mask = None if cv2.countNonZero(mask) >= mask.size * 0.98 else mask
+        if self.input_size is None:
+            dw, dh = self.default_size
+            rw, rh = float(x1 - x0), float(y1 - y0)
+            if rw / rh >= dw / float(dh):
+                self.input_size = (dw, max(32, int(round(dw * rh / rw / 32.0)) * 32))
+            else:
+                self.input_size = (max(32, int(round(dh * rw / rh / 32.0)) * 32), dh)
+
+    def crop(self, frame: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Return (detector input image, (x, y) offset of that image in the frame)."""
+        if self._shape != frame.shape[:2]:
+            self._prepare(frame.shape)
+        if self.rect is None:
+            return frame, (0, 0)
+        x0, y0, x1, y1 = self.rect
+        img = frame[y0:y1, x0:x1]
+        if self.mask is not None:
+            img = cv2.bitwise_and(img, img, mask=self.mask)
+        return img, (x0, y0)
+
+
+# ---- Motion gate in front of inference ----
+class _MotionGate:
+    """Cheap change detector on a downscaled grayscale copy of the frame.
+
+    The reference is the last frame that was sent to inference, so slow changes
+    still add up until they cross the threshold. `keepalive_sec` forces a full
+    pass now and then so presence of people standing still keeps refreshing.
+    """
+
+    def __init__(self, width: int = 160, pixel_delta: int = 25, min_changed_frac: float = 0.005, keepalive_sec: float = 5.0):
+        self.width = max(16, int(width))
+        self.pixel_delta = int(pixel_delta)
+        self.min_changed_frac = float(min_changed_frac)
+        self.keepalive_sec = float(keepalive_sec)
+        self.reference: Optional[np.ndarray] = None
+        self.last_pass = 0.0
+        self.processed = 0
+        self.skipped = 0
+
+    def _small(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.width / float(max(1, w)))
+        small = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def should_process(self, frame: np.ndarray) -> bool:
+        now = time.time()
+        small = self._small(frame)
+        changed = True
+        ref = self.reference
+        if ref is not None and ref.shape == small.shape and (self.keepalive_sec <= 0 or now - self.last_pass < self.keepalive_sec):
+            diff = cv2.absdiff(small, ref)
+            changed = float(np.count_nonzero(diff > self.pixel_delta)) / float(diff.size) >= self.min_changed_frac
+        if changed:
+            self.reference = small
+            self.last_pass = now
+            self.processed += 1
+        else:
+            self.skipped += 1
+        return changed
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.processed + self.skipped
+        return {
+            'processed': self.processed,
+            'skipped': self.skipped,
+            'skipped_ratio': round(self.skipped / float(total), 3) if total else 0.0,
+        }
 
 
 # ---- Known embeddings store ----
+class _Gallery:
+    """Immutable snapshot of the normalized template matrix and its search index."""
+    __slots__ = ('matrix', 'row_ids', 'seg_starts', 'seg_ids', 'index')
+
+    def __init__(self, matrix: np.ndarray, row_ids: np.ndarray, seg_starts: np.ndarray, seg_ids: np.ndarray, index):
+        self.matrix = matrix
+        self.row_ids = row_ids
+        self.seg_starts = seg_starts
+        self.seg_ids = seg_ids
+        self.index = index
+
+
 class EmbeddingStore:
-    def __init__(self):
+    def __init__(self, cfg: Optional[dict] = None):
+        self.cfg = cfg or {}
         self.by_employee: Dict[int, List[np.ndarray]] = {}
         self.employee_meta: Dict[int, Dict[str, Any]] = {}
+        # template_id -> (employee_id, embedding); source of truth for the gallery
+        self._templates: Dict[int, Tuple[int, np.ndarray]] = {}
+        # Pre-normalized gallery: one row per template, rows grouped by employee.
+        # Replaced as a whole on reload so matching always sees a consistent snapshot.
+        self._gallery = _Gallery(
+            np.zeros((0, 0), dtype='float32'),
+            np.zeros((0,), dtype='int64'),
+            np.zeros((0,), dtype='int64'),
+            np.zeros((0,), dtype='int64'),
+            make_index(self.cfg),
+        )
+        # Serializes writers (reload thread, API calls); readers never take it
+        self._write_lock = threading.Lock()
         self._last_load_ts = 0.0
-        self.reload_interval = 60.0  # seconds
+        self.reload_interval = float(self.cfg.get('embedding_reload_interval_sec', 60.0))  # seconds
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._refresh_stop = threading.Event()
         self.load()
 
+    @staticmethod
+    def _query_meta(db) -> Dict[int, Dict[str, Any]]:
+        meta: Dict[int, Dict[str, Any]] = {}
+        for emp_id, name, department in db.query(Employee.id, Employee.name, Employee.department).all():
+            meta[emp_id] = {
+                'name': name,
+                'department': department,
+            }
+        return meta
+
     def load(self, force: bool = False):
+        """Full reload of employees and templates from the database."""
         now = time.time()
         if not force and (now - self._last_load_ts < self.reload_interval):
             return
-        self._last_load_ts = now
-        by_emp: Dict[int, List[np.ndarray]] = {}
-        meta: Dict[int, Dict[str, Any]] = {}
+        templates: Dict[int, Tuple[int, np.ndarray]] = {}
         with get_session() as db:
-            emps = db.query(Employee).all()
-            for e in emps:
-                meta[e.id] = {
-                    'name': e.name,
-                    'department': e.department,
-                }
+            meta = self._query_meta(db)
             # lazy import to avoid circular import
             from database_models import FaceTemplate
-            rows = db.query(FaceTemplate).all()
-            for r in rows:
+            rows = db.query(FaceTemplate.id, FaceTemplate.employee_id, FaceTemplate.embedding).all()
+            for tid, emp_id, blob in rows:
                 try:
-                    arr = np.frombuffer(r.embedding, dtype='float32')
-                    by_emp.setdefault(r.employee_id, []).append(arr)
+                    templates[tid] = (emp_id, np.frombuffer(blob, dtype='float32'))
                 except Exception:
                     continue
+        with self._write_lock:
+            self._last_load_ts = now
+            self._templates = templates
+            self.employee_meta = meta
+            self._rebuild()
+
+    def refresh(self) -> bool:
+        """Incremental reload: fetch only templates that are not loaded yet and drop deleted ones.
+
+        Template ids are compared as sets rather than by max(id)/created_at, so rows committed
+        out of order by concurrent enrollments are still picked up. Returns True on change.
+        """
+        from database_models import FaceTemplate
+        with get_session() as db:
+            meta = self._query_meta(db)
+            db_ids = {tid for (tid,) in db.query(FaceTemplate.id).all()}
+            known = set(self._templates.keys())
+            added_ids = db_ids - known
+            added: Dict[int, Tuple[int, np.ndarray]] = {}
+            if added_ids:
+                rows = db.query(FaceTemplate.id, FaceTemplate.employee_id, FaceTemplate.embedding).filter(
+                    FaceTemplate.id.in_(list(added_ids))
+                ).all()
+                for tid, emp_id, blob in rows:
+                    try:
+                        added[tid] = (emp_id, np.frombuffer(blob, dtype='float32'))
+                    except Exception:
+                        continue
+        removed_ids = known - db_ids
+        with self._write_lock:
+            self._last_load_ts = time.time()
+            meta_changed = meta != self.employee_meta
+            self.employee_meta = meta
+            # Ignore ids that another writer already added/removed meanwhile
+            removed_ids = {tid for tid in removed_ids if tid in self._templates}
+            added = {tid: v for tid, v in added.items() if tid not in self._templates}
+            if not added and not removed_ids:
+                return meta_changed
+            templates = dict(self._templates)
+            for tid in removed_ids:
+                templates.pop(tid, None)
+            templates.update(added)
+            self._templates = templates
+            self._rebuild()
+        print(f"[AI] Embeddings refreshed: +{len(added)} / -{len(removed_ids)} templates")
+        return True
+
+    def apply_employee_delta(self, emp_id: int, added: Optional[List[Tuple[int, np.ndarray]]] = None,
+                             clear: bool = False, meta: Optional[Dict[str, Any]] = None, deleted: bool = False):
+        """Apply an in-process change for one employee without touching the database.
+
+        added: (template_id, embedding) pairs to insert; clear: drop all templates of the
+        employee first; meta: new name/department; deleted: remove employee and templates.
+        """
+        emp_id = int(emp_id)
+        with self._write_lock:
+            templates = self._templates
+            changed = False
+            if clear or deleted:
+                templates = {tid: v for tid, v in templates.items() if v[0] != emp_id}
+                changed = len(templates) != len(self._templates)
+            for tid, emb in (added or []):
+                if emb is None or emb.size == 0:
+                    continue
+                if templates is self._templates:
+                    templates = dict(templates)
+                templates[int(tid)] = (emp_id, np.asarray(emb, dtype='float32').reshape(-1))
+                changed = True
+            if deleted or meta is not None:
+                emp_meta = dict(self.employee_meta)
+                if deleted:
+                    emp_meta.pop(emp_id, None)
+                else:
+                    emp_meta[emp_id] = {**emp_meta.get(emp_id, {}), **meta}
+                self.employee_meta = emp_meta
+            if changed:
+                self._templates = templates
+                self._rebuild()
+        return changed
+
+    def start_background_refresh(self):
+        """Poll the database for template changes every `reload_interval` seconds off the inference path."""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresh_thread.start()
+
+    def stop_background_refresh(self):
+        self._refresh_stop.set()
+
+    def _refresh_loop(self):
+        while not self._refresh_stop.wait(max(1.0, self.reload_interval)):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[AI] Embedding refresh failed: {e}")
+
+    def _rebuild(self):
+        """Rebuild the gallery and by_employee view from `_templates`. Caller holds `_write_lock`."""
+        by_emp: Dict[int, List[np.ndarray]] = {}
+        for tid in sorted(self._templates.keys()):
+            emp_id, arr = self._templates[tid]
+            by_emp.setdefault(emp_id, []).append(arr)
+        self._build_gallery(by_emp)
         self.by_employee = by_emp
-        self.employee_meta = meta
+
+    def _build_gallery(self, by_emp: Dict[int, List[np.ndarray]]):
+        """Stack all templates into one L2-normalized float32 matrix grouped by employee."""
+        rows: List[np.ndarray] = []
+        ids: List[int] = []
+        seg_starts: List[int] = []
+        seg_ids: List[int] = []
+        dim = None
+        for emp_id in sorted(by_emp.keys()):
+            start = len(rows)
+            for arr in by_emp[emp_id]:
+                if arr is None or arr.size == 0:
+                    continue
+                if dim is None:
+                    dim = int(arr.size)
+                if int(arr.size) != dim:
+                    # Skip templates produced by a different model/dimension
+                    continue
+                rows.append(arr.reshape(-1))
+                ids.append(int(emp_id))
+            if len(rows) > start:
+                seg_starts.append(start)
+                seg_ids.append(int(emp_id))
+        if rows:
+            matrix = np.ascontiguousarray(np.vstack(rows), dtype='float32')
+            matrix /= (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8)
+        else:
+            matrix = np.zeros((0, 0), dtype='float32')
+        starts = np.asarray(seg_starts, dtype='int64')
+        row_seg = np.repeat(np.arange(len(seg_starts)), np.diff(np.append(starts, len(rows)))).astype('int64')
+        prev = self._gallery
+        index = make_index(self.cfg)
+        try:
+            index.build(matrix, row_seg, starts, previous=prev.index)
+        except Exception as e:
+            print(f"[AI] Embedding index build failed, using exact search: {e}")
+            index = ExactIndex().build(matrix, row_seg, starts)
+        self._gallery = _Gallery(matrix, np.asarray(ids, dtype='int64'), starts, np.asarray(seg_ids, dtype='int64'), index)
 
     def best_match(self, emb: np.ndarray) -> Tuple[Optional[int], float]:
         # cosine similarity on L2-normalized embeddings
         if emb is None or emb.size == 0:
             return None, 0.0
-        best_emp = None
-        best_sim = -1.0
-        q = emb
-        # normalize
-        norm = np.linalg.norm(q) + 1e-8
-        q = q / norm
-        for emp_id, arrs in self.by_employee.items():
-            for ref in arrs:
-                r = ref
-                r_norm = np.linalg.norm(r) + 1e-8
-                r = r / r_norm
-                sim = float(np.dot(q, r))  # cosine in [-1,1]
-                if sim > best_sim:
-                    best_sim = sim
-                    best_emp = emp_id
-        return best_emp, best_sim if best_sim > 0 else 0.0
+        emp_id, sim, _ = self.best_match_batch(emb.reshape(1, -1))[0]
+        return emp_id, sim
+
+    def best_match_batch(self, embs: np.ndarray) -> List[Tuple[Optional[int], float, float]]:
+        """Match N query embeddings at once.
+
+        Returns one (employee_id, similarity, margin) tuple per row of `embs`, where
+        margin is the gap between the best and second-best employee similarity.
+        """
+        if embs is None or embs.size == 0:
+            return []
+        Q = np.atleast_2d(np.asarray(embs, dtype='float32'))
+        n = Q.shape[0]
+        gallery = self._gallery
+        seg_ids = gallery.seg_ids
+        if gallery.matrix.shape[0] == 0 or gallery.matrix.shape[1] != Q.shape[1]:
+            return [(None, 0.0, 0.0)] * n
+        Q = Q / (np.linalg.norm(Q, axis=1, keepdims=True) + 1e-8)
+        # Best template per employee -> (N, employees), cosine in [-1,1]
+        per_emp = gallery.index.employee_scores(Q)
+        rows = np.arange(n)
+        best_k = np.argmax(per_emp, axis=1)
+        best = per_emp[rows, best_k]
+        if per_emp.shape[1] > 1:
+            per_emp[rows, best_k] = -1.0
+            second = per_emp.max(axis=1)
+        else:
+            second = np.full(n, -1.0, dtype='float32')
+        out: List[Tuple[Optional[int], float, float]] = []
+        for i in range(n):
+            b = max(0.0, float(best[i]))
+            out.append((int(seg_ids[best_k[i]]), b, b - max(0.0, float(second[i]))))
+        return out
 
 
 # ---- Tracking Manager ----
@@ -249,8 +501,28 @@ class TrackingManager:
         self.cfg = cfg
         det_size = tuple(cfg.get('detection_size', [320, 320]))
         providers = [p.strip() for p in str(cfg.get('providers', 'CPUExecutionProvider')).split(',') if p.strip()]
-        self.engine = FaceEngine(det_size, providers)
-        self.emb_store = EmbeddingStore()
+        max_batch = int(cfg.get('inference_max_batch', 8))
+        max_wait_ms = float(cfg.get('inference_max_wait_ms', 5.0))
+        self.engine = None
+        self._engine_args = (det_size, providers, max_batch, max_wait_ms)
+        n_proc = int(cfg.get('inference_processes', 0) or 0)
+        if n_proc > 0:
+            # Models run in worker processes; this process keeps matching, tracking and APIs
+            try:
+                from inference_pool import InferencePool
+                pool = InferencePool(n_proc, det_size, providers, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                                     on_unavailable=self._use_local_engine)
+                if pool.app is not None:
+                    self.engine = pool
+                else:
+                    print("[AI] No inference worker process came up, using in-process engine")
+                    pool.close()
+            except Exception as e:
+                print(f"[AI] Inference pool unavailable, using in-process engine: {e}")
+        if self.engine is None:
+            self.engine = FaceEngine(det_size, providers, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        self.emb_store = EmbeddingStore(cfg)
+        self.emb_store.start_background_refresh()
         self.recog_thresh = float(cfg.get('recognition_threshold', 0.45))
         self.sim_thresh = float(cfg.get('embedding_similarity_threshold', 0.65))
         presence_timeout = float(cfg.get('presence_timeout_sec', cfg.get('tracking_timeout', 60.0)))
@@ -259,6 +531,19 @@ class TrackingManager:
         self.stream_max_width = int(cfg.get('stream_max_width', 960))
         self.jpeg_quality = int(cfg.get('jpeg_quality', 70))
         self.annotation_stride = max(1, int(cfg.get('annotation_stride', 3)))
+        self.annotation_max_age = float(cfg.get('annotation_max_age_sec', 2.0))
+        self.mosaic_fps = max(0.2, float(cfg.get('mosaic_fps', 2.0)))
+        self.mosaic_tile_width = max(80, int(cfg.get('mosaic_tile_width', 320)))
+        self.motion_gate_enabled = bool(cfg.get('motion_gate_enabled', True))
+        self.motion_gate_cfg = {
+            'width': int(cfg.get('motion_gate_width', 160)),
+            'pixel_delta': int(cfg.get('motion_gate_pixel_delta', 25)),
+            'min_changed_frac': float(cfg.get('motion_gate_min_changed_frac', 0.005)),
+            'keepalive_sec': float(cfg.get('motion_gate_keepalive_sec', 5.0)),
+        }
+        self._motion_gates: Dict[int, _MotionGate] = {}
+        self.det_size = det_size
+        self._rois: Dict[int, _CameraROI] = {}
         self.smooth_window = int(cfg.get('smoothing_window', 5))
         self.smooth_min_votes = int(cfg.get('smoothing_min_votes', 3))
         self.iou_match_threshold = float(cfg.get('tracker_iou_threshold', 0.3))
@@ -271,6 +556,9 @@ class TrackingManager:
         self.min_brightness = float(cfg.get('quality_min_brightness', 0.15))
         self.max_brightness = float(cfg.get('quality_max_brightness', 0.9))
         self.min_quality_score = float(cfg.get('quality_min_score', 0.3))
+        # Confirmed tracks reuse their identity and only re-run recognition every N processed frames
+        self.recognition_fast_path = bool(cfg.get('recognition_fast_path', True))
+        self.recognition_reverify_frames = max(1, int(cfg.get('recognition_reverify_frames', 10)))
 
         self._cap_threads: Dict[int, threading.Thread] = {}
         self._cap_stops: Dict[int, threading.Event] = {}
@@ -280,7 +568,27 @@ class TrackingManager:
         self.last_seen: Dict[int, dt.datetime] = {}
         self.last_cam: Dict[int, int] = {}
         self._frame_lock = threading.Lock()
-        self._latest_frames: Dict[int, np.ndarray] = {}
+        self.frame_ring_slots = max(2, int(cfg.get('frame_ring_slots', 4)))
+        # Latest working frames per camera; readers get read-only views, never copies
+        self._frame_rings: Dict[int, FrameRing] = {}
+        # 'shared' keeps the rings in shared memory so inference workers and other processes
+        # read frames in place; 'auto' does that whenever worker processes are in use
+        store_mode = str(cfg.get('frame_store', 'auto')).strip().lower()
+        if store_mode == 'auto':
+            store_mode = 'shared' if n_proc > 0 and not isinstance(self.engine, FaceEngine) else 'local'
+        self._shared_frames: Optional[SharedFrameStore] = None
+        if store_mode == 'shared':
+            try:
+                self._shared_frames = SharedFrameStore(max(self.frame_ring_slots, 6))
+            except Exception as e:
+                print(f"[AI] Shared frame store unavailable, using in-process rings: {e}")
+        # Open capture per camera; frames above are working-size, full resolution is pulled on demand
+        self._captures: Dict[int, Any] = {}
+        # Latest detections per camera as (epoch_ts, tuple of dicts); each entry is replaced
+        # wholesale by the inference thread, so readers never need a lock
+        self._latest_dets: Dict[int, Tuple[float, tuple]] = {}
+        # Encoded JPEGs per camera keyed by (width, quality, annotated) and frame seq, shared by all viewers
+        self._encode_caches: Dict[int, EncodedFrameCache] = {}
         # Bounded cache for tracks - prevents memory leak on long-running instances
         # Max 1000 tracks per camera, auto-expire after 5 minutes of inactivity
         self._tracks: Dict[int, Dict[int, Any]] = {}
@@ -383,6 +691,18 @@ class TrackingManager:
             finally:
                 self.db_write_queue.task_done()
 
+    def reload_embeddings(self) -> None:
+        """Force a full reload of the embedding gallery from the database."""
+        self.emb_store.load(force=True)
+
+    def apply_embedding_delta(self, emp_id: int, added: Optional[List[Tuple[int, np.ndarray]]] = None,
+                              clear: bool = False, meta: Optional[Dict[str, Any]] = None, deleted: bool = False) -> None:
+        """Push an enrollment change for one employee straight into the live gallery."""
+        t0 = time.time()
+        changed = self.emb_store.apply_employee_delta(emp_id, added=added, clear=clear, meta=meta, deleted=deleted)
+        if changed:
+            print(f"[AI] Gallery updated for employee {emp_id} in {(time.time() - t0) * 1000.0:.1f} ms")
+
     # ---- Simple Track structure ----
     class Track:
         def __init__(self, tid: int, bbox: Tuple[int,int,int,int], now: dt.datetime):
@@ -394,6 +714,8 @@ class TrackingManager:
             self.votes = deque(maxlen=8)
             self.final_emp_id: Optional[int] = None
             self.final_since: Optional[dt.datetime] = None
+            self.last_sim = 0.0
+            self.frames_since_recog = 0
 
         def iou(self, bbox: Tuple[int,int,int,int]) -> float:
             x1,y1,x2,y2 = self.bbox
@@ -479,6 +801,19 @@ class TrackingManager:
         th_proc = self._proc_threads.get(cam_id)
         return (th_cap.is_alive() if th_cap else False) or (th_proc.is_alive() if th_proc else False)
 
+    def _use_local_engine(self) -> None:
+        """Called by the inference pool once all its workers failed to start: run the models in-process."""
+        pool = self.engine
+        if pool is None or isinstance(pool, FaceEngine):
+            return
+        print("[AI] Inference workers unavailable, switching to in-process engine")
+        det_size, providers, max_batch, max_wait_ms = self._engine_args
+        self.engine = FaceEngine(det_size, providers, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        try:
+            pool.close()
+        except Exception:
+            pass
+
     def stop_camera(self, cam_id: int) -> None:
         """Stop capture and inference threads for a single camera."""
         evt_cap = self._cap_stops.pop(cam_id, None)
@@ -495,31 +830,18 @@ class TrackingManager:
             th_proc.join(timeout=2.0)
         try:
             with self._frame_lock:
-                if cam_id in self._latest_frames:
-                    self._latest_frames.pop(cam_id, None)
+                self._frame_rings.pop(cam_id, None)
+            if self._shared_frames is not None:
+                self._shared_frames.drop(cam_id)
         except Exception:
             pass
+        self._latest_dets.pop(cam_id, None)
+        self._encode_caches.pop(cam_id, None)
+        self._motion_gates.pop(cam_id, None)
         print(f"[AI] Stopped camera {cam_id}")
 
     def _open_capture(self, src: str):
-        try:
-            s = (src or '').strip()
-            if s.lower().startswith('rtsp://'):
-                os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', 'rtsp_transport;tcp|stimeout;5000000|buffer_size;102400')
-            if s.lower().startswith('webcam:'):
-                idx = int(s.split(':', 1)[1])
-                cap = cv2.VideoCapture(idx, getattr(cv2, 'CAP_DSHOW', 0))
-            elif s.isdigit():
-                cap = cv2.VideoCapture(int(s), getattr(cv2, 'CAP_DSHOW', 0))
-            else:
-                cap = cv2.VideoCapture(s)
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            if s.lower().startswith('webcam:') or s.isdigit():
-                fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-                cap.set(cv2.CAP_PROP_FOURCC, fourcc)
-            return cap
-        except Exception:
-            return None
+        return open_capture(src, self.cfg, max_fps=self.fps_target)
 
     def _run_camera(self, cam_id: int, cam: Camera, stop_evt: threading.Event):
         src = cam.rtsp_url or ''
@@ -527,8 +849,19 @@ class TrackingManager:
         if not cap or not cap.isOpened():
             print(f"[AI] Unable to open camera {cam_id}")
             return
+        print(f"[AI] Camera {cam_id} capture backend: {getattr(cap, 'name', 'opencv')}")
+        self._captures[cam_id] = cap
+        with self._frame_lock:
+            ring = self._frame_rings.get(cam_id)
+            if ring is None:
+                if self._shared_frames is not None:
+                    ring = self._shared_frames.ring(cam_id)
+                else:
+                    ring = FrameRing(self.frame_ring_slots)
+                self._frame_rings[cam_id] = ring
         try:
             interval = 1.0 / float(self.fps_target)
+            next_due = time.monotonic()
             fail_count = 0
             while not stop_evt.is_set():
                 ok, frame = cap.read()
@@ -541,6 +874,8 @@ class TrackingManager:
                             pass
                         time.sleep(0.3)
                         cap = self._open_capture(src)
+                        if cap:
+                            self._captures[cam_id] = cap
                         fail_count = 0
                         if not cap or not cap.isOpened():
                             time.sleep(0.5)
@@ -551,43 +886,78 @@ class TrackingManager:
                 else:
                     fail_count = 0
                 try:
-                    with self._frame_lock:
-                        self._latest_frames[cam_id] = frame
+                    ring.write(frame, ts=time.time())
                 except Exception:
                     pass
-                time.sleep(interval)
+                # The backend keeps only the newest frame, so pacing here no longer builds a backlog
+                next_due = max(next_due + interval, time.monotonic())
+                time.sleep(max(0.0, next_due - time.monotonic()))
         finally:
+            if self._captures.get(cam_id) is cap:
+                self._captures.pop(cam_id, None)
             try:
                 cap.release()
             except Exception:
                 pass
 
     def _run_inference(self, cam_id: int, stop_evt: threading.Event):
-        interval = 1.0 / float(max(1, self.fps_target))
         frame_idx = 0
+        gate = _MotionGate(**self.motion_gate_cfg)
+        self._motion_gates[cam_id] = gate
+        cam_cfg = _load_camera_config(cam_id)
+        roi = _CameraROI(cam_cfg.get('roi'), cam_cfg.get('detection_size'), self.det_size)
+        if roi.active:
+            self._rois[cam_id] = roi
+            print(f"[AI] Camera {cam_id}: roi={cam_cfg.get('roi')} detection_size={cam_cfg.get('detection_size')}")
+        else:
+            self._rois.pop(cam_id, None)
+        last_seq = 0
         while not stop_evt.is_set():
-            frame = None
-            try:
-                with self._frame_lock:
-                    frm = self._latest_frames.get(cam_id)
-                    if frm is not None:
-                        frame = frm.copy()
-            except Exception:
-                frame = None
-            if frame is not None:
-                frame_idx += 1
-                if (frame_idx % self.annotation_stride) == 0:
-                    try:
+            # Sleep until the capture thread publishes a frame we have not seen (no duplicate runs on stalls)
+            seq, _ts, frame = self.wait_new_frame(cam_id, last_seq, timeout=1.0)
+            if frame is None:
+                # Stream stalled: nothing to detect, but people still time out
+                self._update_timeouts(_now_wib())
+                continue
+            last_seq = seq
+            frame_idx += 1
+            if (frame_idx % self.annotation_stride) == 0:
+                try:
+                    if not self.motion_gate_enabled or gate.should_process(frame):
                         self._process_frame(cam_id, frame)
-                    except Exception as e:
-                        print(f"[AI] Inference error cam {cam_id}: {e}")
-            time.sleep(interval)
+                    else:
+                        self._skip_static_frame(cam_id)
+                except Exception as e:
+                    print(f"[AI] Inference error cam {cam_id}: {e}")
+            del frame
+
+    def _skip_static_frame(self, cam_id: int):
+        """Scene unchanged since the last processed frame: keep its detections and only tick timeouts."""
+        entry = self._latest_dets.get(cam_id)
+        if entry is not None:
+            self._latest_dets[cam_id] = (time.time(), entry[1])
+        self._update_timeouts(_now_wib())
+
+    def get_inference_stats(self) -> Dict[str, Any]:
+        """Per-camera counts of frames sent to inference vs skipped by the motion gate."""
+        return {
+            'motion_gate_enabled': self.motion_gate_enabled,
+            'cameras': {str(cid): gate.stats() for cid, gate in list(self._motion_gates.items())},
+            'encode_cache': {str(cid): cache.stats() for cid, cache in list(self._encode_caches.items())},
+        }
 
     def _process_frame(self, cam_id: int, frame: np.ndarray):
-        self.emb_store.load()
-        faces = self.engine.get_faces(frame)
+        fast = self.recognition_fast_path
+        roi = self._rois.get(cam_id)
+        if roi is not None:
+            faces = self._detect_in_roi(roi, frame)
+            if not fast:
+                faces = self.engine.embed_faces(frame, faces)
+        else:
+            faces = self.engine.detect_faces(frame) if fast else self.engine.get_faces(frame)
         now = _now_wib()
-        dets: List[Tuple[Tuple[int,int,int,int], Optional[int], float, float]] = []
+        boxes: List[Tuple[int,int,int,int]] = []
+        kept = []
         for f in (faces or []):
             bbox = getattr(f, 'bbox', None)
             if bbox is None: continue
@@ -595,18 +965,95 @@ class TrackingManager:
                 x1,y1,x2,y2 = [int(v) for v in bbox]
             except Exception:
                 continue
+            boxes.append((x1,y1,x2,y2))
+            kept.append(f)
+        # Faces continuing a confirmed track keep its identity instead of being embedded again
+        reuse: Dict[int, Any] = {}
+        if fast and boxes:
+            tracks = self._tracks.get(cam_id, {})
+            assignments, _ = self._assign_dets_to_tracks(tracks, boxes)
+            for tid, j in assignments:
+                tr = tracks.get(tid)
+                if (tr is not None and tr.final_emp_id is not None and tr.misses == 0
+                        and tr.frames_since_recog < self.recognition_reverify_frames):
+                    reuse[j] = tr
+            pending = [f for j, f in enumerate(kept) if j not in reuse]
+            if pending:
+                self.engine.embed_faces(frame, pending)
+        embs: List[Optional[np.ndarray]] = [None if j in reuse else FaceEngine.get_embedding(f) for j, f in enumerate(kept)]
+        matches = self._match_embeddings(embs)
+        dets: List[Tuple[Tuple[int,int,int,int], Optional[int], float, float, bool]] = []
+        for j, ((x1,y1,x2,y2), (e_id, s, _margin)) in enumerate(zip(boxes, matches)):
             q_score, _ = self._compute_quality(frame, (x1,y1,x2,y2))
+            recognized = j not in reuse
+            if not recognized:
+                e_id, s = reuse[j].final_emp_id, reuse[j].last_sim
             emp_id = None
             sim = 0.0
-            emb = FaceEngine.get_embedding(f)
-            if emb is not None:
-                e_id, s = self.emb_store.best_match(emb)
-                if e_id is not None and s >= self.sim_thresh and q_score >= self.min_quality_score:
-                    emp_id, sim = e_id, s
-            dets.append(((x1,y1,x2,y2), emp_id, sim, q_score))
-        self._update_tracks_with_dets(cam_id, dets, now)
+            if e_id is not None and s >= self.sim_thresh and q_score >= self.min_quality_score:
+                emp_id, sim = e_id, s
+            dets.append(((x1,y1,x2,y2), emp_id, sim, q_score, recognized))
+        det_tids = self._update_tracks_with_dets(cam_id, dets, now)
+        self._publish_detections(cam_id, dets, det_tids)
         self._update_timeouts(now)
 
+    def _detect_in_roi(self, roi: _CameraROI, frame: np.ndarray) -> list:
+        """Detect on the camera's ROI crop and map boxes/landmarks back to frame coordinates."""
+        img, (ox, oy) = roi.crop(frame)
+        faces = self.engine.detect_faces(img, input_size=roi.input_size) or []
+        if ox or oy:
+            for f in faces:
+                try:
+                    f.bbox = np.asarray(f.bbox, dtype='float32') + np.array([ox, oy, ox, oy], dtype='float32')
+                    kps = getattr(f, 'kps', None)
+                    if kps is not None:
+                        f.kps = np.asarray(kps, dtype='float32') + np.array([ox, oy], dtype='float32')
+                except Exception:
+                    continue
+        return faces
+
+    def _publish_detections(self, cam_id: int, dets: list, det_tids: List[Optional[int]]):
+        """Expose the detections of the last processed frame for annotation without re-running inference."""
+        tracks = self._tracks.get(cam_id, {})
+        out = []
+        for (bbox, emp_id, sim, _q, _rec), tid in zip(dets, det_tids):
+            tr = tracks.get(tid) if tid is not None else None
+            if emp_id is None and tr is not None and tr.final_emp_id is not None:
+                # Keep the confirmed identity on screen through low-quality frames
+                emp_id, sim = tr.final_emp_id, tr.last_sim
+            label = 'Unknown'
+            if emp_id is not None:
+                meta = self.emb_store.employee_meta.get(emp_id, {})
+                name = meta.get('name') or f"ID {emp_id}"
+                label = f"ID {emp_id} - {name}"
+            out.append({'bbox': bbox, 'emp_id': emp_id, 'label': label, 'sim': float(sim), 'track_id': tid})
+        self._latest_dets[cam_id] = (time.time(), tuple(out))
+
+    def get_latest_detections(self, cam_id: int, max_age_sec: Optional[float] = None) -> Optional[tuple]:
+        """Detections published by the last processed frame, or None if missing or older than max_age_sec."""
+        entry = self._latest_dets.get(cam_id)
+        if entry is None:
+            return None
+        ts, dets = entry
+        max_age = self.annotation_max_age if max_age_sec is None else max_age_sec
+        if max_age > 0 and (time.time() - ts) > max_age:
+            return None
+        return dets
+
+    def _match_embeddings(self, embs: List[Optional[np.ndarray]]) -> List[Tuple[Optional[int], float, float]]:
+        """Match all faces of a frame in one batch; faces without embedding get (None, 0, 0)."""
+        out: List[Tuple[Optional[int], float, float]] = [(None, 0.0, 0.0)] * len(embs)
+        idx = [i for i, e in enumerate(embs) if e is not None and e.size > 0]
+        if not idx:
+            return out
+        try:
+            results = self.emb_store.best_match_batch(np.stack([embs[i].reshape(-1) for i in idx]))
+        except Exception:
+            return out
+        for i, res in zip(idx, results):
+            out[i] = res
+        return out
+
     def _should_emit_alert(self, emp_id: int, alert_type: str, ts: dt.datetime, min_interval_sec: int = 60) -> bool:
         try:
             key = (int(emp_id), str(alert_type).upper())
@@ -619,51 +1066,74 @@ class TrackingManager:
         except Exception:
             return True
 
-    def _update_tracks_with_dets(self, cam_id: int, dets: List[Tuple[Tuple[int,int,int,int], Optional[int], float, float]], now: dt.datetime):
-        tracks = self._tracks.setdefault(cam_id, {})
-        next_id = self._next_track_id.setdefault(cam_id, 1)
-        unmatched = set(range(len(dets)))
+    def _assign_dets_to_tracks(self, tracks: Dict[int, Any], boxes: List[Tuple[int,int,int,int]]) -> Tuple[List[Tuple[int,int]], set]:
+        """Greedy IoU assignment of detections to tracks; returns ([(tid, det_idx)], unmatched det indices)."""
+        unmatched = set(range(len(boxes)))
         assignments: List[Tuple[int,int]] = []
         for tid, tr in list(tracks.items()):
             best_iou = 0.0
             best_idx = -1
             for j in list(unmatched):
-                iou = tr.iou(dets[j][0])
+                iou = tr.iou(boxes[j])
                 if iou > best_iou:
                     best_iou = iou
                     best_idx = j
             if best_idx >= 0 and best_iou >= self.iou_match_threshold:
                 assignments.append((tid, best_idx))
                 unmatched.discard(best_idx)
-            else:
+        return assignments, unmatched
+
+    def _update_tracks_with_dets(self, cam_id: int, dets: List[Tuple[Tuple[int,int,int,int], Optional[int], float, float, bool]], now: dt.datetime):
+        tracks = self._tracks.setdefault(cam_id, {})
+        next_id = self._next_track_id.setdefault(cam_id, 1)
+        assignments, unmatched = self._assign_dets_to_tracks(tracks, [d[0] for d in dets])
+        det_tids: List[Optional[int]] = [None] * len(dets)
+        assigned = {tid for tid, _ in assignments}
+        for tid, tr in tracks.items():
+            if tid not in assigned:
                 tr.misses += 1
         for tid, j in assignments:
             tr = tracks.get(tid)
             if tr is None: continue
-            bbox, emp_id, sim, q = dets[j]
+            det_tids[j] = tid
+            bbox, emp_id, sim, q, recognized = dets[j]
             tr.bbox = bbox
             tr.last_ts = now
             tr.hits += 1
             tr.misses = 0
+            if not recognized:
+                # Identity carried over by the fast path: no new evidence, so no vote and no sighting
+                tr.frames_since_recog += 1
+                continue
+            tr.frames_since_recog = 0
+            if tr.final_emp_id is not None and emp_id != tr.final_emp_id:
+                # Re-verification disagreed or came back unknown: demote, the next frames are fully
+                # recognized and vote afresh
+                tr.final_emp_id = None
+                tr.final_since = None
+                tr.votes.clear()
             if emp_id is not None:
+                tr.last_sim = sim
                 tr.votes.append(emp_id)
-                maj_id = None
-                if tr.votes:
-                    cnt = Counter(tr.votes)
-                    maj_id, maj_c = cnt.most_common(1)[0]
-                    if maj_id is not None and maj_c >= max(1, self.smooth_min_votes):
-                        tr.final_emp_id = maj_id
-                        if tr.final_since is None:
-                            tr.final_since = now
+                cnt = Counter(tr.votes)
+                maj_id, maj_c = cnt.most_common(1)[0]
+                if maj_id is not None and maj_c >= max(1, self.smooth_min_votes):
+                    tr.final_emp_id = maj_id
+                    if tr.final_since is None:
+                        tr.final_since = now
+                    if maj_id == emp_id:
+                        # sim was computed for this employee on this frame
                         self._on_employee_seen(maj_id, cam_id, now, sim)
         for j in list(unmatched):
-            bbox, emp_id, sim, q = dets[j]
+            bbox, emp_id, sim, q, _ = dets[j]
             tid = next_id
             next_id += 1
             tr = self.Track(tid, bbox, now)
             if emp_id is not None:
                 tr.votes.append(emp_id)
+                tr.last_sim = sim
             tracks[tid] = tr
+            det_tids[j] = tid
         self._next_track_id[cam_id] = next_id
         to_del = []
         for tid, tr in tracks.items():
@@ -671,6 +1141,7 @@ class TrackingManager:
                 to_del.append(tid)
         for tid in to_del:
             tracks.pop(tid, None)
+        return det_tids
 
     def _on_employee_seen(self, emp_id: int, cam_id: int, ts: dt.datetime, sim: float):
         # This function is now non-blocking. It just puts a job in the queue.
@@ -804,42 +1275,61 @@ class TrackingManager:
         }
 
     # ---- Visualization helper (no DB writes) ----
-    def annotate_frame(self, frame: np.ndarray, cam_id: Optional[int] = None) -> np.ndarray:
+    @staticmethod
+    def draw_detections(img: np.ndarray, dets, scale: float = 1.0) -> np.ndarray:
+        """Draw boxes and labels in place; `scale` maps detection coordinates onto a resized image."""
+        for d in dets:
+            try:
+                x1, y1, x2, y2 = [int(v * scale) for v in d['bbox']]
+                known = d.get('emp_id') is not None
+                color = (0, 255, 0) if known else (0, 0, 255)
+                cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+                txt = d.get('label') or 'Unknown'
+                (tw, th), bl = cv2.getTextSize(txt, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+                ty1 = max(0, y1 - th - 6)
+                cv2.rectangle(img, (x1, ty1), (x1 + tw + 6, ty1 + th + 6), (0, 0, 0), -1)
+                cv2.putText(img, txt, (x1 + 3, ty1 + th + 2), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+            except Exception:
+                continue
+        return img
+
+    def _infer_detections(self, img: np.ndarray) -> List[dict]:
+        """Standalone detect + match, used only when no inference results are published for a camera."""
+        faces = [f for f in (self.engine.get_faces(img) or []) if getattr(f, 'bbox', None) is not None]
+        matches = self._match_embeddings([FaceEngine.get_embedding(f) for f in faces])
+        out = []
+        for f, (emp_id, sim, _margin) in zip(faces, matches):
+            label = 'Unknown'
+            if emp_id is not None and sim >= self.sim_thresh:
+                meta = self.emb_store.employee_meta.get(emp_id, {})
+                name = meta.get('name') or f"ID {emp_id}"
+                label = f"ID {emp_id} - {name}"
+            else:
+                emp_id = None
+            out.append({'bbox': tuple(int(v) for v in f.bbox), 'emp_id': emp_id, 'label': label, 'sim': float(sim), 'track_id': None})
+        return out
+
+    def annotate_frame(self, frame: np.ndarray, cam_id: Optional[int] = None, inplace: bool = False,
+                       scale: float = 1.0, allow_inference: bool = True) -> np.ndarray:
+        """Draw the latest published detections of `cam_id` on the frame.
+
+        Falls back to running detection on the frame itself when the camera has no
+        fresh results (AI off for it, or cam_id unknown) and `allow_inference` is set.
+        `scale` only applies to published detections, which are in source-frame pixels.
+        """
         try:
-            img = frame.copy()
+            # Frames from the ring are read-only views: draw on a copy of those
+            img = frame if inplace and frame.flags.writeable else frame.copy()
         except Exception:
             return frame
         try:
-            self.emb_store.load()
-            faces = self.engine.get_faces(img)
-            if not faces:
-                return img
-            for f in faces:
-                try:
-                    bbox = getattr(f, 'bbox', None)
-                    if bbox is None: continue
-                    x1, y1, x2, y2 = [int(v) for v in bbox]
-                    color = (0, 0, 255)
-                    text_color = (0, 0, 255)
-                    label = 'Unknown'
-                    emb = FaceEngine.get_embedding(f)
-                    if emb is not None:
-                        emp_id, sim = self.emb_store.best_match(emb)
-                        if emp_id is not None and sim >= self.sim_thresh:
-                            meta = self.emb_store.employee_meta.get(emp_id, {})
-                            name = meta.get('name') or f"ID {emp_id}"
-                            label = f"ID {emp_id} - {name}"
-                            color = (0, 255, 0)
-                            text_color = (0, 255, 0)
-                    cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
-                    txt = label
-                    (tw, th), bl = cv2.getTextSize(txt, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                    ty1 = max(0, y1 - th - 6)
-                    cv2.rectangle(img, (x1, ty1), (x1 + tw + 6, ty1 + th + 6), (0, 0, 0), -1)
-                    cv2.putText(img, txt, (x1 + 3, ty1 + th + 2), cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 1)
-                except Exception:
-                    continue
-            return img
+            dets = self.get_latest_detections(cam_id) if cam_id is not None else None
+            if dets is None:
+                if not allow_inference:
+                    return img
+                dets = self._infer_detections(img)
+                scale = 1.0
+            return self.draw_detections(img, dets, scale)
         except Exception:
             return frame
 
@@ -851,6 +1341,8 @@ class TrackingManager:
                 'jpeg_quality': int(self.jpeg_quality),
                 'annotation_stride': int(self.annotation_stride),
                 'target_fps': int(self.fps_target),
+                'mosaic_fps': float(self.mosaic_fps),
+                'mosaic_tile_width': int(self.mosaic_tile_width),
             }
         except Exception:
             return {
@@ -858,28 +1350,143 @@ class TrackingManager:
                 'jpeg_quality': 70,
                 'annotation_stride': 3,
                 'target_fps': 20,
+                'mosaic_fps': 2.0,
+                'mosaic_tile_width': 320,
             }
 
     # ---- Frames API for UI streaming ----
+    def get_latest_frame_ref(self, cam_id: int) -> Tuple[int, float, Optional[np.ndarray]]:
+        """(seq, ts, read-only view) of the newest working frame; seq grows by one per captured frame."""
+        ring = self._frame_rings.get(cam_id)
+        if ring is None:
+            return 0, 0.0, None
+        return ring.latest()
+
+    def wait_new_frame(self, cam_id: int, after_seq: int, timeout: float = 1.0) -> Tuple[int, float, Optional[np.ndarray]]:
+        """Block until camera `cam_id` has a frame newer than `after_seq` (or any frame, if the camera was
+        restarted since); (0, 0.0, None) on timeout."""
+        ring = self._frame_rings.get(cam_id)
+        if ring is None:
+            time.sleep(min(timeout, 0.1))
+            return 0, 0.0, None
+        return ring.wait_newer(after_seq, timeout)
+
+    def get_frame_segments(self) -> Dict[int, str]:
+        """Shared-memory segment name per camera for frame_store.SharedFrameReader (empty when frames are local)."""
+        if self._shared_frames is None:
+            return {}
+        return {cid: name for cid, name in self._shared_frames.segment_names().items() if name}
+
     def get_latest_frame(self, cam_id: int) -> Optional[np.ndarray]:
+        """Newest working frame as a read-only view (copy it before drawing on it)."""
         try:
-            with self._frame_lock:
-                frm = self._latest_frames.get(cam_id)
-                if frm is None:
-                    return None
-                return frm.copy()
+            return self.get_latest_frame_ref(cam_id)[2]
         except Exception:
             return None
 
     def get_last_frame(self, cam_id: int) -> Optional[np.ndarray]:
         return self.get_latest_frame(cam_id)
 
+    def _encode_frame(self, cam_id: int, frame: np.ndarray, max_width: int, quality: int,
+                      annotated: bool) -> Optional[bytes]:
+        h, w = frame.shape[:2]
+        scale = 1.0
+        if max_width and w > max_width:
+            scale = max_width / float(w)
+            frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+        if annotated:
+            # Published detections only: one cached encode serves every viewer
+            frame = self.annotate_frame(frame, cam_id, inplace=True, scale=scale, allow_inference=False)
+        ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+        return buf.tobytes() if ok else None
+
+    def get_encoded_frame(self, cam_id: int, max_width: Optional[int] = None, quality: Optional[int] = None,
+                          annotated: bool = True, frame_ref: Optional[Tuple[int, float, np.ndarray]] = None
+                          ) -> Tuple[int, float, Optional[bytes]]:
+        """(seq, ts, JPEG bytes) of the newest frame, encoded at most once per (width, quality, annotated).
+
+        `frame_ref` is a (seq, ts, frame) the caller already holds (e.g. from wait_new_frame);
+        otherwise the latest frame is used. max_width=0 keeps the working resolution.
+        """
+        seq, ts, frame = frame_ref if frame_ref is not None else self.get_latest_frame_ref(cam_id)
+        if frame is None:
+            return 0, 0.0, None
+        max_width = int(self.stream_max_width if max_width is None else max_width)
+        quality = int(self.jpeg_quality if quality is None else quality)
+        cache = self._encode_caches.get(cam_id)
+        if cache is None:
+            cache = self._encode_caches.setdefault(cam_id, EncodedFrameCache())
+        try:
+            return cache.get((max_width, quality, bool(annotated)), seq, ts,
+                             lambda: self._encode_frame(cam_id, frame, max_width, quality, annotated))
+        except Exception:
+            return 0, 0.0, None
+
+    def compose_mosaic(self, cam_ids: List[int], tile_width: Optional[int] = None,
+                       labels: Optional[Dict[int, str]] = None, max_age_sec: float = 5.0
+                       ) -> Tuple[Optional[np.ndarray], List[Dict[str, Any]]]:
+        """One grid image of the newest working frames of `cam_ids` with their detections drawn.
+
+        Returns (image, layout) where layout lists each tile as {cam_id, x, y, w, h, live};
+        tiles without a frame newer than max_age_sec are left dark. (None, []) without cameras.
+        """
+        if not cam_ids:
+            return None, []
+        tile_w = int(tile_width or self.mosaic_tile_width)
+        tile_h = tile_w * 9 // 16
+        cols = int(math.ceil(math.sqrt(len(cam_ids))))
+        rows = int(math.ceil(len(cam_ids) / float(cols)))
+        canvas = np.zeros((rows * tile_h, cols * tile_w, 3), dtype=np.uint8)
+        layout: List[Dict[str, Any]] = []
+        now = time.time()
+        for k, cid in enumerate(cam_ids):
+            x0, y0 = (k % cols) * tile_w, (k // cols) * tile_h
+            # Each tile is drawn as its own contiguous image (OpenCV cannot draw into a canvas slice)
+            tile = np.zeros((tile_h, tile_w, 3), dtype=np.uint8)
+            _seq, ts, frame = self.get_latest_frame_ref(cid)
+            live = frame is not None and (now - ts) <= max_age_sec
+            if live:
+                h, w = frame.shape[:2]
+                scale = min(tile_w / float(w), tile_h / float(h))
+                nw, nh = max(1, int(w * scale)), max(1, int(h * scale))
+                small = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_AREA)
+                dets = self.get_latest_detections(cid)
+                if dets:
+                    self.draw_detections(small, dets, scale)
+                ox, oy = (tile_w - nw) // 2, (tile_h - nh) // 2
+                tile[oy:oy + nh, ox:ox + nw] = small
+            label = (labels or {}).get(cid) or f"CAM {cid}"
+            if not live:
+                label += ' (no signal)'
+            cv2.rectangle(tile, (0, 0), (tile_w - 1, tile_h - 1), (64, 64, 64), 1)
+            cv2.putText(tile, label, (6, 18), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            canvas[y0:y0 + tile_h, x0:x0 + tile_w] = tile
+            layout.append({'cam_id': cid, 'x': x0, 'y': y0, 'w': tile_w, 'h': tile_h, 'live': bool(live)})
+        return canvas, layout
+
+    def get_full_frame(self, cam_id: int, annotate: bool = False) -> Optional[np.ndarray]:
+        """Latest frame at source resolution (for attendance captures); the working frame if unavailable."""
+        work = self.get_latest_frame(cam_id)
+        full = None
+        cap = self._captures.get(cam_id)
+        if cap is not None and hasattr(cap, 'full_frame'):
+            try:
+                full = cap.full_frame()
+            except Exception:
+                full = None
+        if full is None:
+            full = work
+        if full is None or not annotate:
+            return full
+        scale = full.shape[1] / float(work.shape[1]) if work is not None and work.shape[1] else 1.0
+        return self.annotate_frame(full, cam_id, inplace=True, scale=scale)
+
     def get_snapshot(self, cam_id: int) -> Optional[np.ndarray]:
         frm = self.get_latest_frame(cam_id)
         if frm is None:
             return None
         try:
-            return self.annotate_frame(frm, cam_id)
+            return self.annotate_frame(frm, cam_id, inplace=True)
         except Exception:
             return frm
 
@@ -45,6 +45,7 @@
   App.CaptureSeen = App.CaptureSeen || new Set();
   App.CaptureCache = App.CaptureCache || {}; // { [camId]: { url, ts } }
   let currentCamId = null;
+  let mosaicActive = false;
   let lastFrameAt = 0;
   let frameWatch = null;
 
@@ -236,6 +237,14 @@
     videoImg.classList.remove('hidden');
     placeholder.classList.add('hidden');
   }
+  // Live frames arrive as binary JPEG; show them through an object URL and free the previous one
+  let frameUrl = null;
+  function showFrameBytes(bytes) {
+    const url = URL.createObjectURL(new Blob([bytes], { type: 'image/jpeg' }));
+    showFrame(url);
+    if (frameUrl) URL.revokeObjectURL(frameUrl);
+    frameUrl = url;
+  }
   function showPlaceholder(msg) {
     if (!videoImg || !placeholder) return;
     videoImg.classList.add('hidden');
@@ -281,6 +290,12 @@
         cameraButtonsEl.innerHTML = '<div class="text-sm text-gray-500">No cameras found</div>';
         return;
       }
+      const allBtn = document.createElement('button');
+      allBtn.className = 'w-full px-3 py-2 rounded transition text-sm text-center break-words leading-tight bg-gray-700 text-white hover:bg-gray-800';
+      allBtn.innerHTML = '<div>All Cameras</div>';
+      allBtn.title = 'Overview of all running cameras';
+      allBtn.addEventListener('click', () => startMosaic());
+      cameraButtonsEl.appendChild(allBtn);
       cams.forEach(cam => {
         const btn = document.createElement('button');
         const disabled = cam.stream_enabled === false;
@@ -320,6 +335,10 @@
 
   function startStream(camId) {
     if (!socket) return;
+    if (mosaicActive) {
+      socket.emit('stop_mosaic');
+      mosaicActive = false;
+    }
     if (currentCamId !== null) {
       socket.emit('stop_stream', { cam_id: currentCamId });
     }
@@ -335,7 +354,33 @@
       const gap = Date.now() - lastFrameAt;
       // Do not change AI indicator here; it reflects Toggle AI only
     }, 1000);
-    socket.emit('start_stream', { cam_id: camId });
+    socket.emit('start_stream', Object.assign({ cam_id: camId }, viewerConstraints()));
+  }
+
+  // One server-composed grid of all running cameras instead of a stream per camera
+  function startMosaic() {
+    if (!socket) return;
+    if (currentCamId !== null) {
+      socket.emit('stop_stream', { cam_id: currentCamId });
+      currentCamId = null;
+    }
+    mosaicActive = true;
+    showPlaceholder('&lt;CONNECTING...&gt;');
+    socket.emit('start_mosaic');
+  }
+
+  // Tell the server what this viewer can use; it adapts further from frame acks
+  function viewerConstraints() {
+    const c = {};
+    const box = videoImg && videoImg.parentElement;
+    const w = box ? box.clientWidth : 0;
+    if (w) c.max_width = Math.round(w * (window.devicePixelRatio || 1));
+    const conn = navigator.connection;
+    if (conn && (conn.saveData || /(^|-)2g$/.test(conn.effectiveType || ''))) {
+      c.max_fps = 5;
+      c.max_quality = 50;
+    }
+    return c;
   }
 
   // --- Frame Capture helpers ---
@@ -598,10 +643,21 @@
   }
 
   if (socket){
-    socket.on('frame', payload => {
+    socket.on('frame', (payload, ack) => {
+      // Ack every frame: the server adapts this viewer's quality/fps from the round-trip
+      if (typeof ack === 'function') ack();
       if (!payload || !payload.image) return;
+      // Ignore frames still in flight from the camera we just switched away from
+      if (payload.cam_id != null && Number(payload.cam_id) !== Number(currentCamId)) return;
+      lastFrameAt = Date.now();
+      if (typeof payload.image === 'string') showFrame(`data:image/jpeg;base64,${payload.image}`);
+      else showFrameBytes(payload.image);
+    });
+    socket.on('mosaic', payload => {
+      if (!mosaicActive || !payload) return;
+      if (!payload.image) { showPlaceholder('&lt;NO RUNNING CAMERAS&gt;'); return; }
       lastFrameAt = Date.now();
-      showFrame(`data:image/jpeg;base64,${payload.image}`);
+      showFrameBytes(payload.image);
     });
     socket.on('stream_error', payload => {
       const msg = payload && payload.message ? payload.message : 'Stream error';
@@ -632,6 +688,7 @@
     });
     window.addEventListener('beforeunload', () => {
       if (currentCamId !== null) socket.emit('stop_stream', { cam_id: currentCamId });
+      if (mosaicActive) socket.emit('stop_mosaic');
       // Cleanup frame capture preview auto-refresh interval
       if (previewUpdateInterval) {
         clearInterval(previewUpdateInterval);
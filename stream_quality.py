@@ -0,0 +1,144 @@
+"""Per-viewer quality adaptation for live camera streams.
+
+Every viewer of a camera gets frames from a shared ladder of (width, JPEG
+quality) tiers derived from the stream preferences, so viewers on the same
+tier share one cached encode. A viewer starts on the best tier its
+constraints allow (`max_width`, `max_quality`, `max_fps` from the browser)
+and moves along the ladder based on emit backpressure: frames are acked by
+the client, and a viewer with too many unacked frames is skipped (dropped
+frames) instead of queueing more data on its socket.
+
+Adaptation, evaluated about once per second:
+- drops or an ack round-trip above ~2 frame intervals -> one tier down, or,
+  at the lowest tier, half the fps (not below MIN_FPS);
+- several quiet seconds with a short round-trip -> fps back up first, then
+  one tier up, never above the viewer's constraints.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Fraction of the configured stream width and offset to the configured JPEG quality
+TIER_LADDER = ((1.0, 0), (0.75, -5), (0.5, -10), (0.33, -20))
+MIN_WIDTH = 240
+MIN_QUALITY = 30
+MIN_FPS = 2.0
+MAX_IN_FLIGHT = 2
+ACK_TIMEOUT_SEC = 5.0
+UPGRADE_AFTER_SEC = 5.0
+
+
+def build_tiers(base_width: int, base_quality: int) -> List[Tuple[int, int]]:
+    """Distinct (width, quality) tiers, best first; widths are multiples of 16."""
+    tiers: List[Tuple[int, int]] = []
+    for frac, dq in TIER_LADDER:
+        w = max(MIN_WIDTH, int(base_width * frac) // 16 * 16)
+        q = max(MIN_QUALITY, min(95, int(base_quality) + dq))
+        if (w, q) not in tiers:
+            tiers.append((w, q))
+    return tiers
+
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        f = float(v)
+        return f if f > 0 else None
+    except Exception:
+        return None
+
+
+class ViewerState:
+    """Send pacing, backpressure and tier choice for one viewer (Socket.IO sid)."""
+
+    def __init__(self, sid: str, tiers: List[Tuple[int, int]], base_fps: float,
+                 constraints: Optional[Dict[str, Any]] = None):
+        c = constraints or {}
+        max_w, max_q, max_fps = _num(c.get('max_width')), _num(c.get('max_quality')), _num(c.get('max_fps'))
+        self.sid = sid
+        self.adaptive = bool(c.get('adaptive', True))
+        # Best tier: the smallest one still covering the viewer's display width; the lowest tier
+        # is always allowed
+        start = 0
+        if max_w is not None:
+            covering = [i for i, t in enumerate(tiers) if t[0] >= max_w]
+            start = covering[-1] if covering else 0
+        allowed = [t for t in tiers[start:] if max_q is None or t[1] <= max_q]
+        self.tiers = allowed or [tiers[-1]]
+        self.tier_idx = 0
+        self.max_fps = max(MIN_FPS, min(float(base_fps), max_fps or float(base_fps)))
+        self.fps = self.max_fps
+        self.next_due = 0.0
+        self.sent = 0
+        self.acked = 0
+        self.dropped = 0
+        self.rtt = 0.0
+        self._inflight: deque = deque()  # send times of unacked frames
+        self._drops_window = 0
+        self._quiet_since = time.monotonic()
+        self._next_adapt = time.monotonic() + 1.0
+        self._lock = threading.Lock()
+
+    @property
+    def tier(self) -> Tuple[int, int]:
+        return self.tiers[self.tier_idx]
+
+    def ready(self, now: float) -> bool:
+        """Whether a frame should go to this viewer now; counts a drop when it is due but congested."""
+        with self._lock:
+            if now < self.next_due:
+                return False
+            while self._inflight and now - self._inflight[0] > ACK_TIMEOUT_SEC:
+                self._inflight.popleft()  # never acked: treat as lost
+                self._drops_window += 1
+            if len(self._inflight) >= MAX_IN_FLIGHT:
+                self.dropped += 1
+                self._drops_window += 1
+                self.next_due = now + 1.0 / self.fps
+                return False
+            return True
+
+    def on_sent(self, now: float) -> float:
+        with self._lock:
+            self.sent += 1
+            self._inflight.append(now)
+            self.next_due = max(self.next_due + 1.0 / self.fps, now)
+            return now
+
+    def on_ack(self, sent_at: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            try:
+                self._inflight.remove(sent_at)
+            except ValueError:
+                return  # already timed out
+            self.acked += 1
+            rtt = now - sent_at
+            self.rtt = rtt if self.rtt == 0.0 else 0.8 * self.rtt + 0.2 * rtt
+
+    def adapt(self, now: float) -> None:
+        with self._lock:
+            if not self.adaptive or now < self._next_adapt:
+                return
+            self._next_adapt = now + 1.0
+            interval = 1.0 / self.fps
+            congested = self._drops_window > 0 or self.rtt > 2.0 * interval
+            self._drops_window = 0
+            if congested:
+                self._quiet_since = now
+                if self.tier_idx < len(self.tiers) - 1:
+                    self.tier_idx += 1
+                elif self.fps > MIN_FPS:
+                    self.fps = max(MIN_FPS, self.fps / 2.0)
+                return
+            if now - self._quiet_since >= UPGRADE_AFTER_SEC and self.rtt < 0.5 * interval:
+                self._quiet_since = now
+                if self.fps < self.max_fps:
+                    self.fps = min(self.max_fps, self.fps * 2.0)
+                elif self.tier_idx > 0:
+                    self.tier_idx -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        w, q = self.tier
+        return {'width': w, 'quality': q, 'fps': round(self.fps, 1), 'sent': self.sent, 'acked': self.acked,
+                'dropped': self.dropped, 'rtt_ms': round(self.rtt * 1000.0, 1)}